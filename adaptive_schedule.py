@@ -0,0 +1,102 @@
+""" adaptive poll interval: poll fast while GPU state changes, back off on stable or unreachable servers """
+
+import threading
+
+import numpy as np
+
+import config
+
+
+class AdaptiveScheduler:
+    """
+    根据 GPU 状态的变化决定每台服务器下一次查询的间隔
+    - 利用率/显存变化超过 change_threshold（百分点），或有人在等待空闲提醒时，按 min_step 查询
+    - 状态稳定或服务器不可达时，间隔每次乘以 backoff，最大 max_step（update_step 更大时以 update_step 为上限）
+    - 整个集群每秒的查询次数不超过 fleet_budget，超出时所有间隔按比例放大
+    """
+
+    def __init__(self, min_step: float = 2, max_step: float = 120, backoff: float = 1.5,
+                 change_threshold: float = 10, fleet_budget: float | None = 10):
+        self.min_step = min_step
+        self.max_step = max_step
+        self.backoff = backoff
+        self.change_threshold = change_threshold
+        self.fleet_budget = fleet_budget  # polls per second for the whole fleet, None for no limit
+
+        self._lock = threading.Lock()
+        self._intervals = {}  # server -> current interval before the budget is applied
+        self._last = {}  # server -> (utilization_gpu, memory_percent) of the last sample
+        self._fleet_rate = 0.0  # sum of 1 / interval over every server
+
+    def reset(self, name: str, interval: float):
+        """ 用户修改了 update_step，从这个间隔重新开始 """
+        with self._lock:
+            self._set(name, interval, interval)
+
+    def forget(self, name: str):
+        with self._lock:
+            interval = self._intervals.pop(name, None)
+            if interval is not None:
+                self._fleet_rate -= 1 / interval
+            self._last.pop(name, None)
+
+    def _set(self, name: str, interval: float, update_step: float):
+        # never slower than max_step, unless the server is configured to be polled even less often
+        interval = min(max(self.max_step, update_step), max(self.min_step, interval))
+        previous = self._intervals.get(name)
+        if previous is not None:
+            self._fleet_rate -= 1 / previous
+        self._intervals[name] = interval
+        self._fleet_rate += 1 / interval
+
+    def _changed(self, name: str, sample) -> bool:
+        current = (sample.utilization_gpu, sample.memory_percent)
+        last = self._last.get(name)
+        self._last[name] = current
+        if last is None:
+            return False  # nothing to compare with yet
+        if last[0].shape != current[0].shape:
+            return True
+        delta = max(np.nanmax(np.abs(current[0] - last[0]), initial=0), np.nanmax(np.abs(current[1] - last[1]), initial=0))
+        return bool(delta >= self.change_threshold)
+
+    def next_interval(self, name: str, sample, reachable: bool, waiting_for_free: bool, default: float) -> float:
+        """
+        sample: the last gpu_parser.GPUSample or None
+        reachable: whether the last query succeeded
+        waiting_for_free: a busy-to-free reminder is enabled and has not fired yet
+        default: the server's update_step, interval used the first time the server is seen and the cap when above max_step
+        """
+        with self._lock:
+            previous = self._intervals.get(name, default)
+            if not reachable or sample is None:
+                self._last.pop(name, None)
+                self._set(name, previous * self.backoff, default)
+            elif self._changed(name, sample) or waiting_for_free:
+                self._set(name, self.min_step, default)
+            else:
+                self._set(name, previous * self.backoff, default)
+            return self._intervals[name] * self.budget_scale()
+
+    def budget_scale(self) -> float:
+        """ 所有间隔的放大倍数，使集群总查询频率不超过预算 """
+        if self.fleet_budget is None or self._fleet_rate <= self.fleet_budget:
+            return 1.0
+        return self._fleet_rate / self.fleet_budget
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                "servers": len(self._intervals),
+                "fleet_rate": self._fleet_rate,
+                "budget_scale": self.budget_scale(),
+            }
+
+
+adaptive_scheduler = AdaptiveScheduler(
+    min_step=config.adaptive_min_step,
+    max_step=config.adaptive_max_step,
+    backoff=config.adaptive_backoff,
+    change_threshold=config.adaptive_change_threshold,
+    fleet_budget=config.fleet_poll_budget,
+)
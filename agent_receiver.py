@@ -0,0 +1,105 @@
+""" receiver of the gpu_agent.py connections, rebuilds the samples of the "source": "agent" servers from the pushed deltas """
+
+import hmac
+import json
+import time
+import asyncio
+
+import config
+from logger import logger
+from poll_engine import poll_engine
+
+
+def build_output(state: dict, sampled_at: float) -> str:
+    """ the agent's current rows in the format of gpu_watcher.COMMAND, the sample time becomes the timestamp column """
+    timestamp = time.strftime("%Y/%m/%d %H:%M:%S", time.localtime(sampled_at)) + f".{int(sampled_at * 1000) % 1000:03d}"
+    gpu = []
+    for _, row in sorted(state["gpu"].items(), key=lambda item: int(item[0])):
+        name, _, rest = row.partition(",")
+        gpu.append(f"{name}, {timestamp},{rest}")
+    return "\n".join(["@@gpu", *gpu, "@@apps", *state["apps"], "@@host", *state["host"]])
+
+
+def apply_message(state: dict, message: dict):
+    """ merge a "full" / "delta" message of the agent into its current rows """
+    if message["type"] == "full":
+        state["gpu"] = {}
+    state["gpu"].update(message.get("gpu", {}))
+    if "gpu_count" in message:  # GPUs that disappeared (fallen off the bus)
+        state["gpu"] = {i: row for i, row in state["gpu"].items() if int(i) < message["gpu_count"]}
+    for section in ("apps", "host"):
+        if section in message:
+            state[section] = message[section]
+
+
+class AgentReceiver:
+    """
+    接收 gpu_agent.py 推送的增量
+    - 每个 agent 一条长连接，在轮询引擎的事件循环上读取，解析放在轮询线程池中
+    - 同名 agent 重新连接时关闭旧连接
+    - 超过 config.agent_timeout 秒没有消息视为断开
+    """
+
+    def __init__(self, watchers: dict, token: str | None = None, timeout: float = 90):
+        self.watchers = watchers
+        self.token = token
+        self.timeout = timeout
+        self.server = None
+        self._writers = {}  # server name -> writer of its current connection
+
+    def start(self, host: str, port: int):
+        self.server = poll_engine.serve(self._handle, host, port)
+        logger.info(f"Agent receiver listening on {host}:{port}")
+        return self.server
+
+    def _accept(self, hello: dict):
+        """ the watcher of a valid hello, None if the agent is rejected """
+        if hello.get("type") != "hello":
+            return None
+        if self.token is not None and not hmac.compare_digest(str(hello.get("token")), self.token):
+            return None
+        watcher = self.watchers.get(hello.get("name"))
+        if watcher is None or watcher.source != "agent":
+            return None
+        return watcher
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        peer = writer.get_extra_info("peername")
+        watcher = None
+        try:
+            hello = json.loads(await asyncio.wait_for(reader.readline(), self.timeout) or "{}")
+            watcher = self._accept(hello)
+            if watcher is None:
+                logger.warning(f"Rejected agent {hello.get('name')!r} from {peer}")
+                return
+            previous = self._writers.get(watcher.name)
+            if previous is not None:
+                previous.close()
+            self._writers[watcher.name] = writer
+            logger.info(f"Agent of {watcher.name} connected from {peer}")
+
+            state = {"gpu": {}, "apps": [], "host": []}
+            while True:
+                line = await asyncio.wait_for(reader.readline(), self.timeout)
+                if not line:
+                    raise EOFError("connection closed by the agent")
+                message = json.loads(line)
+                if message["type"] == "ping":
+                    continue
+                apply_message(state, message)
+                await poll_engine.run_blocking(watcher.update_agent_sample, build_output(state, message["time"]), message.get("took"))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:  # timeout, reset connection, malformed message
+            if watcher is not None and self._writers.get(watcher.name) is writer:
+                await poll_engine.run_blocking(watcher.set_agent_disconnected, e)
+        finally:
+            if watcher is not None and self._writers.get(watcher.name) is writer:
+                del self._writers[watcher.name]
+            writer.close()
+
+
+def start_agent_receiver(watchers: dict, host: str, port: int) -> AgentReceiver:
+    receiver = AgentReceiver(watchers, token=config.agent_token, timeout=config.agent_timeout)
+    receiver.start(host, port)
+    return receiver
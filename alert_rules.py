@@ -0,0 +1,295 @@
+"""
+declarative alert rules, compiled once into matrices and evaluated against every new sample with a few NumPy operations
+
+alert_rules.json is a list of rules:
+    {"name": "two_free", "condition": "utilization_gpu < 5 and memory_free > 20480", "min_gpus": 2, "for": 3}
+    {"name": "hot", "condition": "temperature > 85", "clear": "temperature < 80", "clear_for": 2, "notify_resolved": true}
+- name: unique, names starting with "reminder:" are reserved for the reminders of the page
+- condition: comparisons of a GPU field with a number joined by `and` / `or` (`and` binds tighter), evaluated per GPU
+- min_gpus: the rule holds when at least this many GPUs match the condition, "all" for every GPU of the server
+- for / clear_for: consecutive samples the rule must hold / not hold before it fires / resolves (debounce)
+- clear: per GPU condition that resolves the rule (hysteresis), by default the rule resolves when it no longer holds
+- edge: only fire on a transition, not when the rule already holds on the first sample
+- repeat: notify on every sample the rule holds, not only when it fires
+- servers: names of the servers the rule applies to, by default every server
+- message: text sent when the rule fires, formatted with {server}, {rule} and {count} (matching GPUs)
+"""
+
+import re
+import json
+import threading
+from dataclasses import dataclass
+
+import numpy as np
+
+import config
+from logger import logger
+
+FIELDS = ("utilization_gpu", "utilization_memory", "memory_used", "memory_free", "memory_total", "memory_percent", "temperature")
+OPERATORS = {"<": np.less, "<=": np.less_equal, ">": np.greater, ">=": np.greater_equal, "==": np.equal, "!=": np.not_equal}
+RESERVED_PREFIX = "reminder:"  # names of the built-in reminders of the page (gpu_watcher.REMINDER_RULES)
+_COMPARISON = re.compile(r"^\s*([a-z_]+)\s*(<=|>=|==|!=|<|>)\s*(-?\d+(?:\.\d*)?)\s*$")
+
+
+def parse_condition(text: str) -> list[list[tuple[str, str, float]]]:
+    """ condition -> disjunction of conjunctions of (field, operator, value), raises ValueError """
+    terms = []
+    for term in re.split(r"\s+or\s+", text.strip()):
+        comparisons = []
+        for comparison in re.split(r"\s+and\s+", term):
+            match = _COMPARISON.match(comparison)
+            if match is None or match[1] not in FIELDS:
+                raise ValueError(f"invalid comparison {comparison!r} in condition {text!r}")
+            comparisons.append((match[1], match[2], float(match[3])))
+        terms.append(comparisons)
+    return terms
+
+
+@dataclass(frozen=True)
+class AlertRule:
+    """ 一条告警规则，字段含义见模块说明 """
+    name: str
+    condition: str
+    min_gpus: int | None = 1  # None: every GPU of the server
+    for_samples: int = 1
+    clear: str | None = None
+    clear_for: int = 1
+    edge: bool = False
+    repeat: bool = False
+    notify_resolved: bool = False
+    servers: frozenset | None = None
+    message: str | None = None
+    opt_in: bool = False  # only evaluated for the servers that enable it in AlertEngine.evaluate (the reminders of the UI)
+
+    @classmethod
+    def from_dict(cls, spec: dict) -> "AlertRule":
+        min_gpus = spec.get("min_gpus", 1)
+        rule = cls(
+            name=spec["name"],
+            condition=spec["condition"],
+            min_gpus=None if min_gpus == "all" else int(min_gpus),
+            for_samples=int(spec.get("for", 1)),
+            clear=spec.get("clear"),
+            clear_for=int(spec.get("clear_for", 1)),
+            edge=bool(spec.get("edge", False)),
+            repeat=bool(spec.get("repeat", False)),
+            notify_resolved=bool(spec.get("notify_resolved", False)),
+            servers=frozenset(spec["servers"]) if "servers" in spec else None,
+            message=spec.get("message"),
+        )
+        parse_condition(rule.condition)  # fail on load rather than in the poll path
+        if rule.clear is not None:
+            parse_condition(rule.clear)
+        if rule.message is not None:
+            try:
+                rule.message.format(server="", rule="", count=0)
+            except (KeyError, IndexError) as e:
+                raise ValueError(f"message {rule.message!r} may only use {{server}}, {{rule}} and {{count}}") from e
+        return rule
+
+
+@dataclass
+class Alert:
+    """ 一次需要发送的告警 """
+    rule: AlertRule
+    server: str
+    count: int  # GPUs matching the condition
+    resolved: bool = False
+
+
+def load_rules(path) -> list[AlertRule]:
+    """ rules of alert_rules.json, a missing file means no rules, invalid rules and reserved names are skipped """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            specs = json.load(f)
+    except FileNotFoundError:
+        return []
+    except ValueError as e:
+        logger.error(f"Ignoring unreadable alert rules {path}: {e}")
+        return []
+    rules = []
+    for spec in specs:
+        try:
+            rule = AlertRule.from_dict(spec)
+        except (KeyError, TypeError, ValueError) as e:
+            logger.error(f"Ignoring invalid alert rule {spec!r}: {e!r}")
+            continue
+        if rule.name.startswith(RESERVED_PREFIX):
+            logger.error(f"Ignoring alert rule {rule.name!r}: names starting with {RESERVED_PREFIX!r} are reserved for the reminders")
+            continue
+        rules.append(rule)
+    return rules
+
+
+class _CompiledRules:
+    """ every rule as matrices: comparisons -> terms (and) -> predicates (or) -> rules """
+
+    def __init__(self, rules: list[AlertRule]):
+        self.rules = rules
+        self.names = [rule.name for rule in rules]
+        comparisons, terms, predicates = {}, {}, []
+
+        def compile_predicate(text):
+            predicate = []
+            for term in parse_condition(text):
+                ids = frozenset(comparisons.setdefault(comparison, len(comparisons)) for comparison in term)
+                predicate.append(terms.setdefault(ids, len(terms)))
+            predicates.append(predicate)
+            return len(predicates) - 1
+
+        self.fire = np.array([compile_predicate(rule.condition) for rule in rules], dtype=np.intp)
+        self.clear = np.array([-1 if rule.clear is None else compile_predicate(rule.clear) for rule in rules], dtype=np.intp)
+
+        self.fields = sorted({field for field, _, _ in comparisons})
+        field_ids = {field: i for i, field in enumerate(self.fields)}
+        self.comparison_field = np.array([field_ids[field] for field, _, _ in comparisons], dtype=np.intp)
+        self.operator_groups = []  # (ufunc, comparison ids, values[:, None])
+        for op, ufunc in OPERATORS.items():
+            ids = [i for i, (_, other, _) in enumerate(comparisons) if other == op]
+            if ids:
+                values = np.array([value for (_, other, value) in comparisons if other == op])[:, None]
+                self.operator_groups.append((ufunc, np.array(ids, dtype=np.intp), values))
+
+        # float32 so the products below run in BLAS, the sums are small integers and exact
+        self.term_comparisons = np.zeros((len(terms), len(comparisons)), dtype=np.float32)
+        for ids, term in terms.items():
+            self.term_comparisons[term, list(ids)] = 1
+        self.term_sizes = self.term_comparisons.sum(axis=1)[:, None]
+        self.predicate_terms = np.zeros((len(predicates), len(terms)), dtype=np.float32)
+        for i, predicate in enumerate(predicates):
+            self.predicate_terms[i, predicate] = 1
+
+        self.min_gpus = np.array([0 if rule.min_gpus is None else rule.min_gpus for rule in rules], dtype=np.int64)
+        self.all_gpus = np.array([rule.min_gpus is None for rule in rules], dtype=bool)
+        self.for_samples = np.array([rule.for_samples for rule in rules], dtype=np.int64)
+        self.clear_for = np.array([rule.clear_for for rule in rules], dtype=np.int64)
+        self.not_edge = np.array([not rule.edge for rule in rules], dtype=bool)
+        self.has_clear = self.clear >= 0
+        self.clear_or_fire = np.where(self.has_clear, self.clear, self.fire)
+        self.notify_resolved = np.array([rule.notify_resolved for rule in rules], dtype=bool)
+
+    def matching_gpus(self, sample) -> np.ndarray:
+        """ number of GPUs of the sample matching every predicate """
+        if not len(self.predicate_terms):
+            return np.zeros(0, dtype=np.int64)
+        columns = np.array([sample.memory_percent if field == "memory_percent" else getattr(sample, field) for field in self.fields])
+        values = columns[self.comparison_field]
+        matches = np.empty(values.shape, dtype=np.float32)
+        for ufunc, ids, thresholds in self.operator_groups:
+            matches[ids] = ufunc(values[ids], thresholds)
+        terms = (self.term_comparisons @ matches == self.term_sizes).astype(np.float32)
+        return ((self.predicate_terms @ terms) > 0).sum(axis=1)
+
+
+class AlertEngine:
+    """
+    告警规则引擎
+    - 所有规则的比较条件去重后编译为矩阵，每个新样本只需几次 NumPy 运算
+    - 去抖 / 迟滞状态按服务器保存为与规则对齐的数组，一次向量运算更新所有规则
+    - 每个样本的开销只取决于规则数和这台服务器的 GPU 数，与集群规模无关
+    """
+
+    STATE_FIELDS = ("on_streak", "off_streak", "active", "armed")
+
+    def __init__(self, rules=()):
+        self._lock = threading.Lock()
+        self._states = {}  # server -> {state field: array aligned with the rules}
+        self._masks = {}  # (server, opt_in, repeat) -> (enabled, repeating), bool arrays aligned with the rules
+        self._compiled = _CompiledRules([])
+        self.set_rules(rules)
+
+    @property
+    def rules(self) -> list[AlertRule]:
+        return self._compiled.rules
+
+    def set_rules(self, rules):
+        """ replace the rules, the state of the rules that keep their name is kept """
+        compiled = _CompiledRules(list({rule.name: rule for rule in rules}.values()))
+        with self._lock:
+            states = {server: self._state_by_name(server) for server in self._states}
+            self._compiled = compiled
+            self._masks = {}
+            self._states = {}
+            for server, state in states.items():
+                self._restore(server, state)
+        logger.debug(f"Compiled {len(compiled.rules)} alert rules")
+
+    def add_rules(self, rules):
+        self.set_rules([*self.rules, *rules])
+
+    def _new_state(self) -> dict:
+        n = len(self._compiled.rules)
+        return {"on_streak": np.zeros(n, dtype=np.int64), "off_streak": np.zeros(n, dtype=np.int64),
+                "active": np.zeros(n, dtype=bool), "armed": np.zeros(n, dtype=bool)}
+
+    def _rule_masks(self, server: str, opt_in: frozenset, repeat: frozenset) -> tuple[np.ndarray, np.ndarray]:
+        key = (server, opt_in, repeat)
+        masks = self._masks.get(key)
+        if masks is None:
+            rules = self._compiled.rules
+            enabled = np.array([(rule.servers is None or server in rule.servers) and (not rule.opt_in or rule.name in opt_in)
+                                for rule in rules], dtype=bool)
+            repeating = np.array([rule.repeat or rule.name in repeat for rule in rules], dtype=bool)
+            masks = self._masks[key] = (enabled, repeating)
+        return masks
+
+    def evaluate(self, server: str, sample, opt_in: frozenset = frozenset(), repeat: frozenset = frozenset()) -> list[Alert]:
+        """
+        用服务器的新样本更新所有规则的状态，返回需要发送的告警
+        opt_in: opt_in rules enabled for this server, repeat: rules that notify on every sample they hold for this server
+        """
+        compiled = self._compiled
+        counts = compiled.matching_gpus(sample)
+        gpus = len(sample)
+        need = np.where(compiled.all_gpus, gpus, compiled.min_gpus)
+        on = counts[compiled.fire] >= need
+        off = np.where(compiled.has_clear, gpus - counts[compiled.clear_or_fire] < need, ~on)
+
+        with self._lock:
+            if self._compiled is not compiled:  # the rules changed meanwhile, evaluate against the new ones
+                return self.evaluate(server, sample, opt_in, repeat)
+            state = self._states.get(server)
+            if state is None:
+                state = self._states[server] = self._new_state()
+            state["on_streak"] = np.where(on, state["on_streak"] + 1, 0)
+            state["off_streak"] = np.where(off, state["off_streak"] + 1, 0)
+            state["armed"] |= ~on
+            fire = ~state["active"] & (state["on_streak"] >= compiled.for_samples) & (state["armed"] | compiled.not_edge)
+            resolve = state["active"] & (state["off_streak"] >= compiled.clear_for)
+            state["active"] = (state["active"] | fire) & ~resolve
+            enabled, repeating = self._rule_masks(server, opt_in, repeat)
+
+        notify = enabled & (fire | (repeating & on) | (resolve & compiled.notify_resolved))
+        return [Alert(compiled.rules[i], server, int(counts[compiled.fire[i]]), resolved=bool(resolve[i]))
+                for i in notify.nonzero()[0].tolist()]
+
+    def _state_by_name(self, server: str) -> dict:
+        state = self._states.get(server)
+        if state is None:
+            return {}
+        return {name: tuple(state[field][i].item() for field in self.STATE_FIELDS) for i, name in enumerate(self._compiled.names)}
+
+    def _restore(self, server: str, saved: dict):
+        state = self._new_state()
+        for i, name in enumerate(self._compiled.names):
+            if name in saved:
+                for field, value in zip(self.STATE_FIELDS, saved[name]):
+                    state[field][i] = value
+        self._states[server] = state
+
+    def get_state(self, server: str) -> dict:
+        """ rule name -> debounce state of the server, what the checkpoint saves """
+        with self._lock:
+            return self._state_by_name(server)
+
+    def restore_state(self, server: str, saved: dict):
+        with self._lock:
+            self._restore(server, saved)
+
+    def forget(self, server: str):
+        with self._lock:
+            self._states.pop(server, None)
+            self._masks = {key: masks for key, masks in self._masks.items() if key[0] != server}
+
+
+alert_engine = AlertEngine(load_rules(config.alert_rules_file))
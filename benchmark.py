@@ -0,0 +1,362 @@
+""" micro benchmarks, run with `python benchmark.py [name[:arg] ...]`, e.g. `python benchmark.py fleet:500` """
+
+import io
+import sys
+import time
+import socket
+import timeit
+import resource
+import threading
+import subprocess
+
+import numpy as np
+
+from gpu_parser import parse_gpu_csv
+
+
+def make_nvidia_smi_output(gpu_count: int, units: bool = False) -> str:
+    """ synthetic `nvidia-smi --query-gpu=...` output, the old COMMAND format (header, units, no uuid) when `units` is set """
+    lines = []
+    if units:
+        lines.append("name, timestamp, temperature.gpu, utilization.gpu [%], utilization.memory [%], "
+                     "memory.total [MiB], memory.free [MiB], memory.used [MiB]")
+    for i in range(gpu_count):
+        util, used = (i * 37) % 101, (i * 1531) % 24576
+        if units:
+            lines.append(f"NVIDIA TITAN RTX, 2025/02/28 07:21:43.123, {30 + i % 50}, {util} %, {util // 2} %, "
+                         f"24576 MiB, {24576 - used} MiB, {used} MiB")
+        else:
+            lines.append(f"NVIDIA TITAN RTX, 2025/02/28 07:21:43.123, {30 + i % 50}, {util}, {util // 2}, "
+                         f"24576, {24576 - used}, {used}, GPU-{i:08x}")
+    return "\n".join(lines) + "\n"
+
+
+def legacy_convert_gpu_info_to_dataframe(info):
+    """ the pandas based parser + summary used before gpu_parser, kept as the baseline """
+    import pandas as pd
+
+    state = pd.read_csv(io.StringIO(info))
+    state.columns = [col.strip() for col in state.columns]
+    state.rename(columns={
+        'name': 'gpu_name',
+        'utilization.gpu [%]': 'utilization.gpu',
+        'utilization.memory [%]': 'utilization.memory',
+        'memory.total [MiB]': 'memory.total',
+        'memory.used [MiB]': 'memory.used',
+        'memory.free [MiB]': 'memory.free',
+    }, inplace=True)
+    state['memory.total'] = state['memory.total'].str.rstrip(' MiB').astype(int)
+    state['memory.used'] = state['memory.used'].str.rstrip(' MiB').astype(int)
+    state['memory'] = state.apply(lambda row: f"{row['memory.used']} MiB / {row['memory.total']} MiB", axis=1)
+    state['utilization.memory'] = state.apply(lambda row: f"{row['memory.used'] / row['memory.total'] * 100:.2f} %", axis=1)
+    state.drop(columns=['memory.total', 'memory.free', 'memory.used'], inplace=True)
+
+    gpu_util_list = state['utilization.gpu'].str.rstrip('%').astype(float)
+    memory_util_list = state['utilization.memory'].str.rstrip('%').astype(float)
+    return state, gpu_util_list.mean(), memory_util_list.mean()
+
+
+def fast_parse_and_summarize(info):
+    sample = parse_gpu_csv(info)
+    return sample, sample.utilization_gpu.mean(), sample.memory_percent.mean()
+
+
+def _report(title: str, func, number: int):
+    seconds = min(timeit.repeat(func, number=number, repeat=5)) / number
+    print(f"  {title:<28} {seconds * 1e6:10.1f} us/call")
+    return seconds
+
+
+def bench_parser():
+    """ gpu_parser.parse_gpu_csv vs the old pandas read_csv + row-wise apply """
+    for gpu_count in (8, 64):
+        legacy_text = make_nvidia_smi_output(gpu_count, units=True)
+        fast_text = make_nvidia_smi_output(gpu_count, units=False)
+        print(f"{gpu_count} GPUs:")
+        legacy = _report("pandas + apply (legacy)", lambda: legacy_convert_gpu_info_to_dataframe(legacy_text), 200)
+        fast = _report("parse_gpu_csv", lambda: fast_parse_and_summarize(fast_text), 2000)
+        print(f"  speedup {legacy / fast:.1f}x")
+
+
+def bench_lifecycle():
+    """ stop / restart latency of a watcher whose host accepts TCP but never answers """
+    from gpu_watcher import SingleGPUServerWatcher
+
+    black_hole = socket.socket()
+    black_hole.bind(("127.0.0.1", 0))
+    black_hole.listen()
+    watcher = SingleGPUServerWatcher("black-hole", "127.0.0.1", "nobody", port=black_hole.getsockname()[1],
+                                     update_step=1, banner_timeout=1)
+    for action in ("restart", "stop"):
+        watcher.start_run(loop=True)
+        time.sleep(0.5)  # the query is now blocked waiting for the banner
+        start = time.perf_counter()
+        watcher.restart_run(loop=True) if action == "restart" else watcher.stop_run()
+        print(f"  {action:<28} {(time.perf_counter() - start) * 1e3:10.1f} ms")
+    watcher.stop_run()
+    black_hole.close()
+
+
+def _simulate_fleet(servers: int, gpus: int, seconds: int, seed: int = 0):
+    """ per second utilization / memory percent of every GPU, jobs of random length start and stop """
+    rng = np.random.default_rng(seed)
+    busy = np.zeros((seconds, servers, gpus), dtype=bool)
+    for s in range(servers):
+        for g in range(gpus):
+            t, state = 0, rng.random() < 0.5
+            while t < seconds:
+                length = int(rng.exponential(3 * 3600 if state else 2 * 3600)) + 60
+                busy[t:t + length, s, g] = state
+                t, state = t + length, not state
+    util = np.where(busy, 85 + rng.normal(0, 3, busy.shape), 0)
+    memory = np.where(busy, 60.0, 0.0)
+    return busy, util, memory
+
+
+def bench_adaptive():
+    """ SSH polls and free-GPU detection delay of a fixed update_step vs adaptive_schedule over a simulated day """
+    from types import SimpleNamespace
+    from adaptive_schedule import AdaptiveScheduler
+
+    servers, gpus, seconds, update_step = 20, 8, 24 * 3600, 10
+    busy, util, memory = _simulate_fleet(servers, gpus, seconds)
+    have_free = (~busy).any(axis=2)  # (seconds, servers)
+    freed = np.argwhere(~have_free[:-1] & have_free[1:]) + [1, 0]  # (time, server) of busy -> free transitions
+
+    def run(next_interval):
+        polls = [[] for _ in range(servers)]
+        for s in range(servers):
+            t = 0.0
+            while t < seconds:
+                polls[s].append(t)
+                t += next_interval(s, int(t))
+        delays = []
+        for t, s in freed:
+            i = np.searchsorted(polls[s], t)
+            if i < len(polls[s]):
+                delays.append(polls[s][i] - t)
+        return sum(map(len, polls)), np.mean(delays), np.max(delays)
+
+    def adaptive(reminders):
+        scheduler = AdaptiveScheduler(fleet_budget=None)
+        return lambda s, t: scheduler.next_interval(
+            str(s), SimpleNamespace(utilization_gpu=util[t, s], memory_percent=memory[t, s]), True,
+            waiting_for_free=reminders and not have_free[t, s], default=update_step)
+
+    print(f"{servers} servers x {gpus} GPUs, {seconds // 3600}h, {len(freed)} busy -> free transitions")
+    for title, policy in (("fixed update_step", lambda s, t: update_step),
+                          ("adaptive", adaptive(False)),
+                          ("adaptive, reminders on", adaptive(True))):
+        polls, mean_delay, max_delay = run(policy)
+        print(f"  {title:<28} {polls:8d} polls  detection delay mean {mean_delay:6.1f}s max {max_delay:6.1f}s")
+
+
+def bench_fleet(hosts="200", seconds=20):
+    """ `hosts` watchers loop watching simulated servers (simulator.py in a subprocess) for `seconds` """
+    import config
+    from simulator import simulated_server_info
+    from gpu_watcher import SingleGPUServerWatcher, SSH_STATUS_LUT
+
+    hosts = int(hosts)
+    config.adaptive_polling = False  # measure the engine at a fixed update_step
+    port = 22000 + hosts % 1000
+    simulator = subprocess.Popen([sys.executable, "simulator.py", "--bind", "0.0.0.0", "--port", str(port), "--latency", "0.05",
+                                  "--latency-jitter", "0.05"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        for _ in range(100):
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=1).close()
+                break
+            except OSError:
+                time.sleep(0.1)
+
+        latencies, errors = [], [0]
+        lock = threading.Lock()
+
+        def on_snapshot(snapshot):
+            with lock:
+                if snapshot.ssh_state == SSH_STATUS_LUT["success"] and snapshot.poll_latency is not None:
+                    latencies.append(snapshot.poll_latency)
+                elif snapshot.ssh_state == SSH_STATUS_LUT["error"]:
+                    errors[0] += 1
+
+        watchers = []
+        for server in simulated_server_info(hosts, port):
+            watcher = SingleGPUServerWatcher(**server, update_step=1)
+            watcher.listeners.append(on_snapshot)
+            watchers.append(watcher)
+        start = time.perf_counter()
+        for watcher in watchers:
+            watcher.start_run(loop=True)
+        time.sleep(seconds)
+        elapsed = time.perf_counter() - start
+        for watcher in watchers:
+            watcher.stop_run()
+
+        p50, p99 = np.percentile(latencies, [50, 99]) if latencies else (np.nan, np.nan)
+        print(f"{hosts} hosts, update_step 1s, {elapsed:.0f}s:")
+        print(f"  throughput {len(latencies) / elapsed:8.1f} polls/s   errors {errors[0]}")
+        print(f"  latency    p50 {p50 * 1e3:7.1f} ms   p99 {p99 * 1e3:7.1f} ms")
+        print(f"  threads    {threading.active_count():8d}   peak RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MiB")
+    finally:
+        simulator.terminate()
+
+
+def bench_metrics():
+    """ cost of one metrics.timer() block, enabled and disabled """
+    from metrics import Metrics
+
+    def timed(registry):
+        with registry.timer("parse", "server"):
+            pass
+
+    enabled, disabled = Metrics(enabled=True), Metrics(enabled=False)
+    _report("no timer", lambda: None, 200000)
+    _report("timer, disabled", lambda: timed(disabled), 200000)
+    _report("timer, enabled", lambda: timed(enabled), 200000)
+
+
+def _random_sample(rng, gpu_count: int):
+    from gpu_parser import GPUSample
+
+    free = rng.choice([0, 2048, 12000, 30000, 40960], size=gpu_count).astype(np.float64)
+    return GPUSample(
+        gpu_name=np.array(["NVIDIA A100-SXM4-40GB"] * gpu_count), timestamp=np.array([""] * gpu_count),
+        temperature=np.full(gpu_count, 40.0), utilization_gpu=np.where(free > 30000, 0.0, 90.0),
+        utilization_memory=np.zeros(gpu_count), memory_total=np.full(gpu_count, 40960.0), memory_free=free,
+        memory_used=40960 - free, uuid=np.array([f"GPU-{i}" for i in range(gpu_count)]),
+    )
+
+
+def bench_gpu_index(hosts="500"):
+    """ FreeGPUIndex update / query vs scanning every server's sample """
+    from gpu_index import FreeGPUIndex
+
+    hosts, gpu_count = int(hosts), 8
+    rng = np.random.default_rng(0)
+    samples = {f"node-{i:04d}": _random_sample(rng, gpu_count) for i in range(hosts)}
+    index = FreeGPUIndex()
+    for server, sample in samples.items():
+        index.update(server, sample)
+
+    def scan(count, min_free_mib):
+        found = []
+        for server, sample in samples.items():
+            free = np.sort(sample.memory_free[sample.utilization_gpu < index.max_util])[::-1]
+            if len(free) >= count and free[count - 1] >= min_free_mib:
+                found.append(server)
+        return found
+
+    assert sorted(p.server for p in index.find(4, 40000)) == sorted(scan(4, 40000))
+    fresh = [_random_sample(rng, gpu_count) for _ in range(101)]
+    pairs = ((f"node-{i % hosts:04d}", fresh[i % 101]) for i in range(10 ** 9))  # never the sample already indexed
+    print(f"{hosts} servers x {gpu_count} GPUs, {index.free_count()} free:")
+    _report("index.update (one sample)", lambda: index.update(*next(pairs)), 2000)
+    _report("index.find(4, 40 GB, limit 5)", lambda: index.find(4, 40000, limit=5), 20000)
+    _report("index.find(4, 40 GB), all", lambda: index.find(4, 40000), 2000)
+    _report("scan every sample", lambda: scan(4, 40000), 20)
+
+
+def legacy_summarize(sample, free_threshold=1):
+    """ summerize_gpu_state before fleet_table.summarize_blocks, kept as the baseline """
+    gpu_util_list = sample.utilization_gpu
+    memory_util_list = sample.memory_percent
+    free = (gpu_util_list < free_threshold) & (memory_util_list < free_threshold)
+    return {
+        "gpu_name": ", ".join(sorted(set(sample.gpu_name.tolist()))),
+        "avg_gpu_util": float(gpu_util_list.mean()),
+        "avg_memory_util": float(memory_util_list.mean()),
+        "all_free": bool(free.all()),
+        "have_free": bool(free.any()),
+        "dead_process": bool(memory_util_list.min() > 0 and gpu_util_list.max() < free_threshold),
+    }
+
+
+def bench_fleet_table(hosts="256"):
+    """ GPUStateTable.summarize (one grouped reduction) vs summarizing every server's sample in a Python loop """
+    from fleet_table import GPUStateTable
+
+    hosts, gpu_count = int(hosts), 8
+    rng = np.random.default_rng(0)
+    samples = {f"node-{i:04d}": _random_sample(rng, gpu_count) for i in range(hosts)}
+    samples["node-0000"].utilization_gpu[3] = np.nan  # "[N/A]" poisons the averages, its GPU is not free
+    table = GPUStateTable()
+    for server, sample in samples.items():
+        table.update(server, sample, time.time())
+
+    summary = table.summarize()
+    for server, sample in samples.items():
+        expected, got = legacy_summarize(sample), summary.host(server)
+        assert all(expected[k] == got[k] or (np.isnan(expected[k]) and np.isnan(got[k])) for k in got), (server, expected, got)
+
+    def loop():
+        summaries = {server: legacy_summarize(sample) for server, sample in samples.items()}
+        return sum(s["have_free"] for s in summaries.values())
+
+    fresh = [_random_sample(rng, gpu_count) for _ in range(101)]
+    pairs = ((f"node-{i % hosts:04d}", fresh[i % 101]) for i in range(10 ** 9))
+    print(f"{hosts} servers x {gpu_count} GPUs = {len(table)} rows, {summary.free_gpus} free:")
+    _report("table.update (one sample)", lambda: table.update(*next(pairs), 0.0), 20000)
+    _report("table.summarize (whole fleet)", table.summarize, 2000)
+    _report("per-server summary loop", loop, 50)
+
+
+def bench_alerts():
+    """ AlertEngine.evaluate of one 8 GPU sample as the number of rules grows, vs the old hard-coded reminder """
+    from alert_rules import AlertEngine, AlertRule
+
+    rng = np.random.default_rng(0)
+    samples = [_random_sample(rng, 8) for _ in range(101)]
+    cycle = (samples[i % 101] for i in range(10 ** 9))
+    summary = {"have_free": False, "all_free": False}
+
+    def legacy(sample):  # the have_free / all_free transitions of remind_through_dingding before alert_rules
+        new = legacy_summarize(sample)
+        transitions = (not summary["have_free"] and new["have_free"], not summary["all_free"] and new["all_free"])
+        summary.update(new)
+        return transitions
+
+    _report("hard-coded have / all free", lambda: legacy(next(cycle)), 5000)
+    for count in (2, 20, 200):
+        rules = [AlertRule(f"rule-{i}", f"utilization_gpu < {i % 50} and memory_free > {1000 * (i % 40)} or temperature > {60 + i % 30}",
+                           min_gpus=1 + i % 4, for_samples=1 + i % 3) for i in range(count)]
+        engine = AlertEngine(rules)
+        _report(f"alert engine, {count} rules", lambda: engine.evaluate("node", next(cycle)), 5000)
+
+
+HEAVY_MODULES = ("paramiko", "pandas", "streamlit", "requests", "DingDingBot")
+
+
+def bench_import():
+    """ wall time of `python -c "import <module>"` and which heavy dependencies it pulls in """
+    def run(code):
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+        return time.perf_counter() - start, output
+
+    interpreter = min(run("pass")[0] for _ in range(5))
+    print(f"  {'(interpreter startup)':<28} {interpreter * 1e3:10.1f} ms")
+    for module in ("i18n_service", "ding_notify", "gpu_watcher", "collector", "http_api"):
+        code = f"import sys, {module}; print(' '.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+        runs = [run(code) for _ in range(5)]
+        seconds = min(seconds for seconds, _ in runs) - interpreter
+        print(f"  {module:<28} {seconds * 1e3:10.1f} ms   loads: {runs[0][1].strip() or '-'}")
+
+
+BENCHMARKS = {
+    "parser": bench_parser,
+    "lifecycle": bench_lifecycle,
+    "adaptive": bench_adaptive,
+    "fleet": bench_fleet,
+    "metrics": bench_metrics,
+    "import": bench_import,
+    "gpu_index": bench_gpu_index,
+    "fleet_table": bench_fleet_table,
+    "alerts": bench_alerts,
+}
+
+if __name__ == "__main__":
+    for arg in sys.argv[1:] or BENCHMARKS:
+        name, _, param = arg.partition(":")
+        print(f"== {arg}")
+        BENCHMARKS[name](param) if param else BENCHMARKS[name]()
@@ -0,0 +1,78 @@
+""" checkpoint of the latest state of every watcher, reloaded at startup so the page is not empty until every server answers """
+
+import os
+import time
+import pickle
+import threading
+from pathlib import Path
+
+from logger import logger
+
+CHECKPOINT_VERSION = 1
+
+
+def save_checkpoint(path, watchers: dict):
+    """ 原子写入：先写临时文件再 rename，进程中途退出也不会留下半个文件 """
+    path = Path(path)
+    data = {
+        "version": CHECKPOINT_VERSION,
+        "saved_at": time.time(),
+        "servers": {name: state for name, watcher in list(watchers.items()) if (state := watcher.checkpoint_state()) is not None},
+    }
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")  # several processes may share one checkpoint
+    with open(tmp, "wb") as f:
+        pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def load_checkpoint(path) -> dict:
+    """ server name -> state saved by SingleGPUServerWatcher.checkpoint_state, empty if there is no usable checkpoint """
+    try:
+        with open(path, "rb") as f:
+            data = pickle.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception as e:  # truncated / written by an incompatible version of the code
+        logger.warning(f"Ignoring unreadable checkpoint {path}: {e!r}")
+        return {}
+    if not isinstance(data, dict) or data.get("version") != CHECKPOINT_VERSION:
+        logger.warning(f"Ignoring checkpoint {path} of another version")
+        return {}
+    return data["servers"]
+
+
+class Checkpointer:
+    """ 后台线程，有新快照时每 interval 秒保存一次 """
+
+    def __init__(self, path, watchers: dict, interval: float = 30):
+        self.path = path
+        self.watchers = watchers
+        self.interval = interval
+        self._dirty = threading.Event()
+        self._thread = None
+
+    def mark_dirty(self, snapshot=None):
+        """ 可直接作为 collector 的 listener """
+        self._dirty.set()
+
+    def save(self):
+        self._dirty.clear()
+        try:
+            start = time.perf_counter()
+            save_checkpoint(self.path, self.watchers)
+            logger.debug(f"Saved checkpoint {self.path} in {time.perf_counter() - start:.3f}s")
+        except Exception as e:
+            logger.error(f"Failed to save checkpoint {self.path}: {e!r}")
+
+    def _run(self):
+        while True:
+            self._dirty.wait()
+            time.sleep(self.interval)  # batch every snapshot of the interval into one write
+            self.save()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="gpu-checkpoint", daemon=True)
+            self._thread.start()
@@ -0,0 +1,131 @@
+"""
+terminal front end, runs the watchers of server_info.json without the web server
+
+    python -m cli                  live fleet table, refreshed as new samples arrive
+    python -m cli --once           query every server once and print the table
+    python -m cli --once --json    the same as JSON (the format of the HTTP API's /api/state)
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import threading
+
+from rich.console import Console
+from rich.live import Live
+from rich.table import Table
+
+import config
+from collector import GPUCollector, DEFAULT_INFO_FILE
+from gpu_watcher import SSH_STATUS_LUT, FREE_PERSETNAGE
+from i18n_service import i18n
+from logger import logger
+
+STATE_ICON = {SSH_STATUS_LUT["success"]: "✅", SSH_STATUS_LUT["loading"]: "⏳", SSH_STATUS_LUT["error"]: "❌"}
+COLUMNS = ("server", "state", "gpus", "avg_gpu_util", "avg_mem_util", "free", "users", "latency", "updated")
+
+
+def format_row(snapshot) -> tuple[str, ...]:
+    """ table cells of one server """
+    sample, summary = snapshot.gpu_state, snapshot.summerized_gpu_state
+    state = STATE_ICON[snapshot.ssh_state] + (" ⌛" if snapshot.stale else "")
+    latency = f"{snapshot.poll_latency:.2f}s" if snapshot.poll_latency is not None else ""
+    updated = time.strftime("%H:%M:%S", time.localtime(snapshot.updated_at))
+    if sample is None or summary is None:
+        return snapshot.name, state, snapshot.message, "", "", "", "", latency, updated
+    free = int(((sample.utilization_gpu < FREE_PERSETNAGE) & (sample.memory_percent < FREE_PERSETNAGE)).sum())
+    return (
+        snapshot.name,
+        state,
+        f"{len(sample)} x {summary['gpu_name']}",
+        f"{summary['avg_gpu_util']:.1f}%",
+        f"{summary['avg_memory_util']:.1f}%",
+        f"[green]{free}[/green]" if free else "0",
+        ", ".join(summary["users"]),
+        latency,
+        updated,
+    )
+
+
+class FleetTable:
+    """ 只重新格式化快照有变化的服务器行 """
+
+    def __init__(self):
+        self._rows = {}  # server -> (seq, cells)
+
+    def render(self, snapshots: dict) -> Table:
+        table = Table(expand=True)
+        for column in COLUMNS:
+            table.add_column(i18n.get_text(f"cli_{column}"), no_wrap=column != "users")
+        for name, snapshot in snapshots.items():
+            cached = self._rows.get(name)
+            if cached is None or cached[0] != snapshot.seq:
+                if cached is not None and snapshot.ssh_state == SSH_STATUS_LUT["loading"]:
+                    cells = (name, STATE_ICON[snapshot.ssh_state], *cached[1][2:])  # keep the last values while polling
+                else:
+                    cells = format_row(snapshot)
+                cached = self._rows[name] = (snapshot.seq, cells)
+            table.add_row(*cached[1])
+        return table
+
+
+def run_once(collector: GPUCollector, deadline: float, as_json: bool):
+    result = collector.refresh_all(deadline)
+    snapshots = collector.snapshots()
+    if as_json:
+        from http_api import render_json
+        data = json.loads(render_json(snapshots))
+        data["refresh"] = {"latency": result.latency, "stale": result.stale, "elapsed": result.elapsed}
+        print(json.dumps(data, ensure_ascii=False, indent=2))
+    else:
+        Console().print(FleetTable().render(snapshots))
+    sys.stdout.flush()
+    # do not wait for the servers that missed the deadline, their queries are still blocked in the poll threads
+    os._exit(0 if not result.stale else 1)
+
+
+def run_live(collector: GPUCollector, refresh_per_second: float):
+    changed = threading.Event()
+    collector.add_listener(lambda snapshot: changed.set())
+    collector.start(loop=True)
+    table = FleetTable()
+    with Live(table.render(collector.snapshots()), auto_refresh=False, screen=False) as live:
+        try:
+            while True:
+                changed.wait()
+                changed.clear()
+                live.update(table.render(collector.snapshots()), refresh=True)
+                time.sleep(1 / refresh_per_second)  # samples arriving meanwhile are drawn in the next frame
+        except KeyboardInterrupt:
+            pass
+    collector.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m cli", description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--info-file", default=DEFAULT_INFO_FILE, help="server list, default: server_info.json")
+    parser.add_argument("--once", action="store_true", help="query every server once and exit, the exit code is 1 if any server missed the deadline")
+    parser.add_argument("--json", action="store_true", help="with --once, print JSON instead of a table")
+    parser.add_argument("--deadline", type=float, default=config.fleet_refresh_deadline, help="seconds --once waits for the servers")
+    parser.add_argument("--fps", type=float, default=4, help="maximum redraws per second of the live table")
+    parser.add_argument("--log-level", default="WARNING", help="log level, logs go to stderr")
+    args = parser.parse_args(argv)
+
+    logging.getLogger().setLevel(args.log_level)
+    logger.setLevel(args.log_level)
+    for handler in logging.getLogger().handlers:  # keep stdout clean for the table / JSON
+        if hasattr(handler, "console"):
+            handler.console = Console(stderr=True)
+
+    collector = GPUCollector(args.info_file)
+    if args.once:
+        run_once(collector, args.deadline, args.json)
+    else:
+        run_live(collector, args.fps)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+""" shared collector, owns every SingleGPUServerWatcher independently of the web sessions """
+
+import os
+import json
+import time
+import threading
+import concurrent.futures
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import config
+from gpu_watcher import SingleGPUServerWatcher, WatcherSnapshot, SSH_STATUS_LUT, FREE_PERSETNAGE
+from gpu_index import FreeGPUIndex
+from fleet_table import GPUStateTable, FleetSummary
+from checkpoint import Checkpointer, load_checkpoint
+from ssh_pool import ssh_pool, SSHTarget
+from poll_engine import poll_engine
+from alert_rules import alert_engine
+from logger import logger
+
+DEFAULT_INFO_FILE = Path(__file__).parent / "server_info.json"
+
+
+def parse_gateway(gateway) -> SSHTarget | None:
+    """
+    the "gateway" of a server_info.json entry, a jump host given either as
+    - "user@host:port" (like ssh -J), authenticated with the default keys / ssh agent
+    - {"ip", "port", "username", "password", "key_filename", "gateway"}, the gateway can itself be behind a gateway
+    """
+    if gateway is None:
+        return None
+    if isinstance(gateway, str):
+        username, _, address = gateway.rpartition("@")
+        host, _, port = address.partition(":")
+        return SSHTarget(host, int(port or 22), username or None, connect_timeout=config.ssh_connect_timeout,
+                         auth_timeout=config.ssh_auth_timeout, banner_timeout=config.ssh_banner_timeout)
+    return SSHTarget(
+        gateway["ip"],
+        gateway.get("port", 22),
+        gateway.get("username"),
+        gateway.get("password"),
+        connect_timeout=gateway.get("connect_timeout", config.ssh_connect_timeout),
+        auth_timeout=gateway.get("auth_timeout", config.ssh_auth_timeout),
+        banner_timeout=gateway.get("banner_timeout", config.ssh_banner_timeout),
+        key_filename=gateway.get("key_filename"),
+        gateway=parse_gateway(gateway.get("gateway")),
+    )
+
+
+def read_server_info(info_file=DEFAULT_INFO_FILE) -> dict[str, dict]:
+    """ server name -> keyword arguments of SingleGPUServerWatcher, for every entry of the info file """
+    servers = {}
+    with open(info_file, "r") as f:
+        server_info = json.load(f)
+    for server in server_info:  # server is already a dictionary
+        source = server.get("source", "ssh")  # "agent": the server runs gpu_agent.py, no SSH login needed
+        servers[server["name"]] = dict(
+            name=server["name"],
+            ip=server["ip"] if source == "ssh" else server.get("ip", ""),
+            username=server["username"] if source == "ssh" else server.get("username", ""),
+            password=server.get("password", ""),
+            port=server.get("port", 22),  # default port is 22 if not specified
+            update_step=server.get("update_step", 10),  # default update step is 10 if not specified
+            stream=server.get("stream", False),  # stream `nvidia-smi --loop-ms` output while loop watching
+            stream_interval_ms=server.get("stream_interval_ms", 1000),
+            # SSH timeouts in seconds, default to the values in config.py
+            connect_timeout=server.get("connect_timeout", config.ssh_connect_timeout),
+            auth_timeout=server.get("auth_timeout", config.ssh_auth_timeout),
+            banner_timeout=server.get("banner_timeout", config.ssh_banner_timeout),
+            command_timeout=server.get("command_timeout", config.ssh_command_timeout),
+            key_filename=server.get("key_filename"),  # private key file, tried before the password
+            gateway=parse_gateway(server.get("gateway")),  # jump host, every server behind it shares one connection to it
+            source=source,
+        )
+    return servers
+
+
+def get_server_watcher(info_file=DEFAULT_INFO_FILE):
+    return {name: SingleGPUServerWatcher(**kwargs) for name, kwargs in read_server_info(info_file).items()}
+
+
+@dataclass
+class FleetRefreshResult:
+    """ 一次全量刷新的结果 """
+    latency: dict[str, float] = field(default_factory=dict)  # server -> seconds, for the servers that answered in time
+    stale: list[str] = field(default_factory=list)  # servers that missed the deadline, still being queried
+    elapsed: float = 0.0
+
+
+class GPUCollector:
+    """ 采集器：整个进程只有一个，所有会话共享同一组 watcher，只读取它们发布的快照 """
+
+    def __init__(self, info_file=DEFAULT_INFO_FILE):
+        self.info_file = info_file
+        self._info_stat = self._stat_info_file()  # before reading, so an edit made meanwhile is reloaded
+        self.server_info = read_server_info(info_file)
+        self.watchers = {name: SingleGPUServerWatcher(**kwargs) for name, kwargs in self.server_info.items()}
+        self.listeners = []
+        self.gpu_index = FreeGPUIndex(max_util=config.free_gpu_max_util)  # free GPUs of the whole fleet
+        self.gpu_table = GPUStateTable(free_threshold=FREE_PERSETNAGE)  # every GPU of the fleet in one set of arrays
+        for watcher in self.watchers.values():
+            watcher.listeners.append(self._on_snapshot)
+        self.http_server = None
+        self.agent_receiver = None
+        self.loop = None  # loop mode given to start(), None until started
+        self._reload_lock = threading.Lock()
+        self._reloader = None
+
+        self.checkpointer = None
+        if config.checkpoint_file is not None:
+            self.restore(config.checkpoint_file)
+            self.checkpointer = Checkpointer(config.checkpoint_file, self.watchers, interval=config.checkpoint_interval)
+            self.add_listener(self.checkpointer.mark_dirty)
+
+    def restore(self, path):
+        """ warm start: show the checkpointed state of every known server, flagged as stale """
+        states = load_checkpoint(path)
+        restored = [name for name, state in states.items() if name in self.watchers]
+        for name in restored:
+            self.watchers[name].restore_checkpoint(states[name])
+        if restored:
+            logger.info(f"Restored {len(restored)} servers from checkpoint {path}")
+
+    def _on_snapshot(self, snapshot: WatcherSnapshot):
+        if snapshot.restored_at is not None or snapshot.stale:
+            pass  # possibly days old, not offered as free until the server answers again
+        elif snapshot.gpu_state is not None:
+            self.gpu_index.update(snapshot.name, snapshot.gpu_state)
+            self.gpu_table.update(snapshot.name, snapshot.gpu_state, snapshot.updated_at)
+        elif snapshot.ssh_state == SSH_STATUS_LUT["error"]:
+            self.gpu_index.remove(snapshot.name)  # loading keeps the last sample indexed
+            self.gpu_table.remove(snapshot.name)
+        for listener in self.listeners:
+            listener(snapshot)
+
+    def add_listener(self, listener):
+        """ listener(snapshot) 会在任一服务器发布新快照时被调用（在轮询线程中） """
+        self.listeners.append(listener)
+
+    def start_http_api(self, host: str, port: int):
+        from http_api import start_http_api
+        self.http_server = start_http_api(self, host, port)
+
+    def start_agent_receiver(self, host: str, port: int):
+        from agent_receiver import start_agent_receiver
+        self.agent_receiver = start_agent_receiver(self.watchers, host, port)
+
+    def start(self, loop: bool = False):
+        self.loop = loop
+        for watcher in list(self.watchers.values()):
+            watcher.start_run(loop=loop or watcher.is_looping)  # servers restored while loop watching keep looping
+        if self.checkpointer is not None:
+            self.checkpointer.start()
+        if config.info_file_reload_interval is not None:
+            self.watch_info_file(config.info_file_reload_interval)
+        logger.info(f"Collector started {len(self.watchers)} watchers")
+
+    def stop(self):
+        for watcher in list(self.watchers.values()):
+            watcher.stop_run()
+        if self.checkpointer is not None:
+            self.checkpointer.save()
+
+    def _stat_info_file(self):
+        try:
+            stat = os.stat(self.info_file)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _add_watcher(self, watcher: SingleGPUServerWatcher):
+        watcher.listeners.append(self._on_snapshot)
+        self.watchers[watcher.name] = watcher
+        if self.loop is not None:
+            watcher.start_run(loop=self.loop)
+
+    def _remove_watcher(self, name: str):
+        watcher = self.watchers.pop(name)
+        watcher.listeners.remove(self._on_snapshot)  # a query finishing during stop_run must not re-index the server
+        watcher.stop_run()
+        alert_engine.forget(name)
+        self.gpu_index.remove(name)
+        self.gpu_table.remove(name)
+
+    def reload(self) -> tuple[list[str], list[str], list[str]]:
+        """
+        重新读取服务器列表，只处理有变化的服务器，返回 (新增, 移除, 修改)
+        - 新增的服务器按 start() 的模式开始监视，移除的停止监视并断开连接
+        - 修改的服务器原地更新（SingleGPUServerWatcher.reconfigure），历史数据和提醒状态保留
+        - 文件无效时保留当前配置
+        """
+        with self._reload_lock:
+            try:
+                server_info = read_server_info(self.info_file)
+            except (OSError, ValueError, KeyError, TypeError) as e:  # also a file caught in the middle of being written
+                logger.error(f"Ignoring invalid {self.info_file}: {e!r}")
+                return [], [], []
+            added = [name for name in server_info if name not in self.watchers]
+            removed = [name for name in self.watchers if name not in server_info]
+            changed = [name for name, kwargs in server_info.items() if name in self.server_info and kwargs != self.server_info[name]]
+            targets = {watcher.target.key: watcher.target for watcher in self.watchers.values()}
+            for name in removed:
+                self._remove_watcher(name)
+            for name in changed:
+                old = self.server_info[name]
+                self.watchers[name].reconfigure(**{key: value for key, value in server_info[name].items() if old.get(key) != value})
+            for name in added:
+                self._add_watcher(SingleGPUServerWatcher(**server_info[name]))
+            self.server_info = server_info
+            in_use = {watcher.target.key for watcher in self.watchers.values()}
+            for key, target in targets.items():
+                if key not in in_use:  # servers with the same address / user share one pooled connection
+                    ssh_pool.close(target)
+        if added or removed or changed:
+            logger.info(f"Reloaded {self.info_file}: added {added}, removed {removed}, changed {changed}")
+        return added, removed, changed
+
+    def watch_info_file(self, interval: float):
+        """ reload the info file whenever its modification time or size changes """
+        def run():
+            while True:
+                time.sleep(interval)
+                stat = self._stat_info_file()
+                if stat is not None and stat != self._info_stat:
+                    self._info_stat = stat
+                    self.reload()
+
+        if self._reloader is None:
+            self._reloader = threading.Thread(target=run, name="gpu-info-reload", daemon=True)
+            self._reloader.start()
+
+    def refresh_all(self, deadline: float) -> FleetRefreshResult:
+        """ 同时查询所有服务器，最多等待 deadline 秒；超时的服务器标记为 stale，查询在后台继续 """
+        start = time.perf_counter()
+        futures = {poll_engine.poll(watcher): name for name, watcher in list(self.watchers.items())}
+        done, pending = concurrent.futures.wait(futures, timeout=deadline)
+
+        result = FleetRefreshResult(elapsed=time.perf_counter() - start)
+        for future in done:
+            result.latency[futures[future]] = future.result()
+        for future in pending:
+            name = futures[future]
+            result.stale.append(name)
+            watcher = self.watchers.get(name)
+            if watcher is not None:  # not removed by a reload meanwhile
+                watcher.mark_stale()
+        logger.info(f"Refreshed {len(done)}/{len(futures)} servers in {result.elapsed:.2f}s, stale: {result.stale}")
+        return result
+
+    def find_free_gpus(self, count: int = 1, min_free_mib: float = 0, model: str | None = None, limit: int | None = None):
+        """ 有 count 张空闲 GPU 的服务器，见 FreeGPUIndex.find """
+        return self.gpu_index.find(count, min_free_mib, model, limit)
+
+    def fleet_summary(self) -> FleetSummary:
+        """ 所有可达服务器的汇总，见 GPUStateTable.summarize """
+        return self.gpu_table.summarize()
+
+    def snapshots(self) -> dict[str, WatcherSnapshot]:
+        """ 所有服务器的最新快照 """
+        return {name: watcher.snapshot for name, watcher in list(self.watchers.items())}
+
+
+if __name__ == "__main__":
+    # headless collector, loop watch every server until interrupted
+    collector = GPUCollector()
+    collector.start(loop=True)
+    if config.http_api_port is not None:
+        collector.start_http_api(config.http_api_host, config.http_api_port)
+    if config.agent_receiver_port is not None:
+        collector.start_agent_receiver(config.agent_receiver_host, config.agent_receiver_port)
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        collector.stop()
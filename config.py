@@ -1,3 +1,4 @@
+from pathlib import Path
 
 # choose in ["zh_CN", "en_US"]
 # zh_CN for Chinese, en_US for English
@@ -7,4 +8,61 @@ page_update_freq = 1 # update page every 1 seconds
 
 log_level = "INFO" # choose in ["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"]
 
-dingding_keyText = "通知" # set key text for dingding notification (required by Dingding)
\ No newline at end of file
+dingding_keyText = "通知" # set key text for dingding notification (required by Dingding)
+
+ssh_keepalive_interval = 30 # seconds between SSH keepalive packets on pooled connections
+ssh_reconnect_backoff_base = 1 # first reconnect delay (seconds) after a pooled connection fails, doubled on every failure
+ssh_reconnect_backoff_max = 300 # upper bound of the reconnect delay (seconds)
+
+poll_max_concurrency = 32 # at most this many servers are queried at the same time by the poll engine
+poll_host_timeout = 60 # seconds a single server query may take before it is marked as timed out
+poll_jitter = 0.1 # random spread of update_step (0.1 means +-10%) so servers do not poll in lockstep
+
+history_capacity = 3600 # samples kept in memory per server, older samples are downsampled to disk
+history_downsample = 10 # average every N evicted samples into one row of the on-disk history
+history_dir = Path(__file__).parent / "history" # directory of the on-disk history, set to None to only keep the in-memory samples
+history_plot_window = 3600 # seconds of history plotted on each server page
+
+http_api_host = "0.0.0.0" # address of the JSON / Prometheus endpoint
+http_api_port = None # port of the JSON / Prometheus endpoint (e.g. 9400), None to disable it
+stream_queue_size = 256 # events queued per /api/stream subscriber, a subscriber further behind gets one full snapshot instead
+stream_snapshot_interval = 60 # seconds between the full snapshots pushed on /api/stream (only if anything changed)
+stream_keepalive = 15 # seconds, an idle /api/stream connection gets a comment line so dead clients are noticed
+
+notify_coalesce_window = 10 # seconds, reminders from all servers within this window are sent as one digest message
+notify_rate_per_minute = 20 # DingDing robots accept at most 20 messages per minute
+notify_dedup_ttl = 60 # seconds, the same reminder of the same server is sent at most once within this time
+notify_max_retries = 3 # retries with exponential backoff before a notification is dropped
+
+overview_grid_threshold = 20 # show the compact overview table instead of every server panel when there are more servers
+
+fleet_refresh_deadline = 5 # seconds the "update all" button waits, servers answering later are marked as stale
+
+ssh_connect_timeout = 10 # seconds to establish the TCP connection, can be overridden per server in server_info.json
+ssh_auth_timeout = 10 # seconds to wait for the authentication response
+ssh_banner_timeout = 10 # seconds to wait for the SSH banner
+ssh_command_timeout = 30 # a command producing no output for this many seconds is aborted
+stop_timeout = 2 # seconds stop_run waits for the watch task to exit
+
+adaptive_polling = True # poll faster while GPU state changes and back off on stable or unreachable servers, False to always wait update_step
+adaptive_min_step = 2 # seconds, interval while utilization / memory is changing or a free-GPU reminder is pending
+adaptive_max_step = 120 # seconds, upper bound of the interval of stable or unreachable servers
+adaptive_backoff = 1.5 # the interval is multiplied by this after every poll without change
+adaptive_change_threshold = 10 # percentage points of utilization / memory change that count as a change
+fleet_poll_budget = 10 # polls per second for all servers together, None for no limit
+
+self_metrics = True # time every stage of a poll (SSH connect / command, parsing, summary, notification), exported on /metrics and the debug page
+
+free_gpu_max_util = 10 # GPUs below this utilization (%) are offered by the free GPU finder, sorted by free memory
+
+checkpoint_file = Path(__file__).parent / "checkpoint.pkl" # latest state of every server, reloaded (as stale) at startup, None to disable
+checkpoint_interval = 30 # seconds, at most one checkpoint write per interval
+
+agent_receiver_host = "0.0.0.0" # address the gpu_agent.py of the "source": "agent" servers connect to
+agent_receiver_port = None # port of the agent receiver (e.g. 9401), None to disable it
+agent_token = None # shared secret the agents must send (gpu_agent.py --token), None to accept any agent
+agent_timeout = 90 # seconds without a message (agents ping every 30s) before an agent is considered disconnected
+
+alert_rules_file = Path(__file__).parent / "alert_rules.json" # declarative alert rules, see alert_rules.py, a missing file means only the reminders of the page
+
+info_file_reload_interval = 2 # seconds between checks of server_info.json, edits are applied without a restart, None to disable
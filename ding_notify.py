@@ -1,18 +1,36 @@
 import json
-import requests
-from DingDingBot.DDBOT import DingDing
+import threading
+from pathlib import Path
 
 from config import dingding_keyText
 from logger import logger
 from i18n_service import i18n
 
-with open('dingtalk_token.txt', 'r') as f:
-    webhook = f.read()
-dd = DingDing(webhook=webhook)
+TOKEN_FILE = Path(__file__).parent / "dingtalk_token.txt"
+# result of the latest send, shared by every session and watcher
+ding_status = {"available": False}
+
+_dd = None  # DingDing client, built on the first send
+_webhook = None
+_lock = threading.Lock()
+
+def _get_client():
+    """ read the webhook and build the client once, a missing token file counts as an empty webhook """
+    global _dd, _webhook
+    with _lock:
+        if _webhook is None:
+            _webhook = TOKEN_FILE.read_text().strip() if TOKEN_FILE.exists() else ""
+            if _webhook not in ("", "<your dingding webhook url>"):
+                from DingDingBot.DDBOT import DingDing  # pulls in requests, only needed once something is sent
+                _dd = DingDing(webhook=_webhook)
+        return _dd
+
 def ding_print_txt(content:str):
     error = None
     try:
-        if webhook == "" or webhook == "<your dingding webhook url>":
+        dd = _get_client()
+        if dd is None:
+            ding_status["available"] = False
             return i18n.get_text("dingdingTest_emptyToken")
         
         result=dd.Send_Text_Msg(Content=dingding_keyText + ": " + content)
@@ -25,6 +43,7 @@ def ding_print_txt(content:str):
     except Exception as e:
         logger.warning(f"Error validating DingDing webhook: {e}")
         error = e
+    ding_status["available"] = error is None
     return error
     
 if __name__ == '__main__':
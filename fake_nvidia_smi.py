@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+stand-in for nvidia-smi on machines without GPUs, answers the queries of gpu_agent.py
+
+    python gpu_agent.py --collector 127.0.0.1:9401 --name node-a --nvidia-smi ./fake_nvidia_smi.py
+
+FAKE_GPUS (default 4) sets the number of GPUs, every FAKE_PERIOD seconds (default 10) the busy GPUs become free and the
+free GPUs busy, each busy GPU runs one compute process (the caller, so it has an owner)
+only needs the standard library, like gpu_agent.py
+"""
+
+import os
+import sys
+import time
+
+
+def gpu_state(count: int, period: float) -> list[dict]:
+    phase = int(time.time() // period)
+    gpus = []
+    for i in range(count):
+        busy = (i + phase) % 2 == 0
+        used = 30000 if busy else 0
+        gpus.append({
+            "index": str(i),
+            "gpu_name": "NVIDIA A100-SXM4-40GB",
+            "name": "NVIDIA A100-SXM4-40GB",
+            "timestamp": time.strftime("%Y/%m/%d %H:%M:%S.000"),
+            "temperature.gpu": "65" if busy else "35",
+            "utilization.gpu": "90" if busy else "0",
+            "utilization.memory": "40" if busy else "0",
+            "memory.total": "40960",
+            "memory.free": str(40960 - used),
+            "memory.used": str(used),
+            "uuid": f"GPU-fake-{i}",
+            "busy": busy,
+        })
+    return gpus
+
+
+def main(args: list[str]) -> int:
+    gpus = gpu_state(int(os.environ.get("FAKE_GPUS", "4")), float(os.environ.get("FAKE_PERIOD", "10")))
+    for arg in args:
+        if arg.startswith("--query-gpu="):
+            fields = arg.split("=", 1)[1].split(",")
+            for gpu in gpus:
+                print(", ".join(gpu[field] for field in fields))
+            return 0
+        if arg.startswith("--query-compute-apps="):
+            values = {"pid": str(os.getppid()), "used_memory": "30000"}  # a live process, so its owner can be looked up
+            fields = arg.split("=", 1)[1].split(",")
+            for gpu in gpus:
+                if gpu["busy"]:
+                    print(", ".join(gpu["uuid"] if field == "gpu_uuid" else values[field] for field in fields))
+            return 0
+    print("fake_nvidia_smi.py only answers --query-gpu= and --query-compute-apps=", file=sys.stderr)
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,148 @@
+""" fleet-wide columnar GPU state: one array per field for every GPU of every server, summarized with grouped NumPy reductions """
+
+import threading
+from dataclasses import dataclass
+
+import numpy as np
+
+COLUMNS = ("utilization_gpu", "memory_used", "memory_total", "temperature")  # GPUSample attributes kept in the table
+
+
+def summarize_blocks(utilization: np.ndarray, memory_percent: np.ndarray, starts: np.ndarray, free_threshold: float) -> dict:
+    """
+    the summary flags of gpu_watcher.summerize_gpu_state for many servers at once
+    the GPUs of server i are the rows starts[i]:starts[i + 1], every server has at least one GPU
+    a GPU is free when both its utilization and memory are below free_threshold, the same test as the reminder rules
+    a NaN value (unreadable field) makes the averages NaN and its GPU not free
+    """
+    counts = np.diff(np.append(starts, len(utilization)))
+    free = (utilization < free_threshold) & (memory_percent < free_threshold)
+    max_util = np.maximum.reduceat(utilization, starts)
+    min_memory = np.minimum.reduceat(memory_percent, starts)
+    return {
+        "avg_gpu_util": np.add.reduceat(utilization, starts) / counts,
+        "avg_memory_util": np.add.reduceat(memory_percent, starts) / counts,
+        "all_free": np.logical_and.reduceat(free, starts),
+        "have_free": np.logical_or.reduceat(free, starts),
+        "dead_process": (min_memory > 0) & (max_util < free_threshold),
+    }
+
+
+def _finite_mean(values: np.ndarray) -> float:
+    """ mean over the GPUs whose value could be read, NaN if there is none """
+    finite = values[np.isfinite(values)]
+    return float(finite.mean()) if len(finite) else float("nan")
+
+
+@dataclass
+class FleetSummary:
+    """ 整个集群的汇总，每台服务器的字段是与 servers 对齐的数组 """
+    servers: list[str]
+    gpu_name: list[str]
+    avg_gpu_util: np.ndarray
+    avg_memory_util: np.ndarray
+    all_free: np.ndarray
+    have_free: np.ndarray
+    dead_process: np.ndarray
+    gpus: int  # fleet-wide from here on
+    free_gpus: int
+    fleet_gpu_util: float
+    fleet_memory_util: float
+
+    def host(self, server: str) -> dict:
+        """ one server in the format of summerize_gpu_state (without users) """
+        i = self.servers.index(server)
+        return {
+            "gpu_name": self.gpu_name[i],
+            "avg_gpu_util": float(self.avg_gpu_util[i]),
+            "avg_memory_util": float(self.avg_memory_util[i]),
+            "all_free": bool(self.all_free[i]),
+            "have_free": bool(self.have_free[i]),
+            "dead_process": bool(self.dead_process[i]),
+        }
+
+
+class GPUStateTable:
+    """
+    集群 GPU 状态表（struct of arrays）
+    - 每台服务器占连续的一段行，新样本到达时原地覆盖这段行
+    - 只有服务器加入 / 移除或 GPU 数变化时才重新排布（O(行数)）
+    - summarize() 一次分组归约得到所有服务器和整个集群的汇总
+    """
+
+    def __init__(self, free_threshold: float = 1):
+        self.free_threshold = free_threshold  # gpu_watcher.FREE_PERSETNAGE
+        self._lock = threading.Lock()
+        self.servers = []  # host id -> server name
+        self.gpu_name = []  # host id -> ", ".join of its GPU models
+        self._ids = {}  # server name -> host id
+        self.starts = np.zeros(0, dtype=np.intp)  # host id -> first row
+        self.counts = np.zeros(0, dtype=np.intp)  # host id -> number of GPUs
+        self.host = np.zeros(0, dtype=np.int32)  # row -> host id
+        self.gpu_index = np.zeros(0, dtype=np.int32)  # row -> GPU index on its server
+        self.columns = {column: np.zeros(0) for column in COLUMNS}
+        self.updated_at = np.zeros(0)  # row -> time of the sample
+
+    def __len__(self) -> int:
+        return len(self.host)
+
+    def update(self, server: str, sample, timestamp: float):
+        """ 用服务器的最新 gpu_parser.GPUSample 覆盖它的行 """
+        count = len(sample)
+        with self._lock:
+            host_id = self._ids.get(server)
+            if host_id is None or self.counts[host_id] != count:
+                self._relayout(server, count)
+                host_id = self._ids[server]
+            rows = slice(self.starts[host_id], self.starts[host_id] + count)
+            for column in COLUMNS:
+                self.columns[column][rows] = getattr(sample, column)
+            self.updated_at[rows] = timestamp
+            self.gpu_name[host_id] = ", ".join(sorted(set(sample.gpu_name.tolist())))
+
+    def remove(self, server: str):
+        with self._lock:
+            if server in self._ids:
+                self._relayout(server, 0)
+
+    def _relayout(self, server: str, count: int):
+        """ drop the rows of server and append `count` new (NaN) rows for it at the end """
+        keep = np.ones(len(self.host), dtype=bool)
+        counts = self.counts.tolist()
+        old = self._ids.get(server)
+        if old is not None:
+            keep[self.starts[old]:self.starts[old] + counts[old]] = False
+            del self.servers[old], self.gpu_name[old], counts[old]
+        if count:
+            self.servers.append(server)
+            self.gpu_name.append("")
+            counts.append(count)
+        self._ids = {name: i for i, name in enumerate(self.servers)}
+        self.counts = np.array(counts, dtype=np.intp)
+        self.starts = np.cumsum(self.counts) - self.counts
+        self.host = np.repeat(np.arange(len(counts), dtype=np.int32), self.counts)
+        self.gpu_index = (np.arange(len(self.host)) - np.repeat(self.starts, self.counts)).astype(np.int32)
+        for column in COLUMNS:
+            self.columns[column] = np.concatenate((self.columns[column][keep], np.full(count, np.nan)))
+        self.updated_at = np.concatenate((self.updated_at[keep], np.full(count, np.nan)))
+
+    def summarize(self) -> FleetSummary:
+        """ 所有服务器的 avg_gpu_util / all_free / have_free / dead_process，以及整个集群的汇总 """
+        with self._lock:
+            utilization = self.columns["utilization_gpu"]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                memory_percent = self.columns["memory_used"] / self.columns["memory_total"] * 100
+            if len(self.servers):
+                hosts = summarize_blocks(utilization, memory_percent, self.starts, self.free_threshold)
+            else:
+                hosts = {key: np.zeros(0) for key in ("avg_gpu_util", "avg_memory_util", "all_free", "have_free", "dead_process")}
+            free = (utilization < self.free_threshold) & (memory_percent < self.free_threshold)
+            return FleetSummary(
+                servers=list(self.servers),
+                gpu_name=list(self.gpu_name),
+                **hosts,
+                gpus=len(utilization),
+                free_gpus=int(free.sum()),
+                fleet_gpu_util=_finite_mean(utilization),
+                fleet_memory_util=_finite_mean(memory_percent),
+            )
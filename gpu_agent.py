@@ -0,0 +1,116 @@
+"""
+agent for GPU nodes, samples nvidia-smi locally and pushes the changes to the collector over one TCP connection
+
+    python gpu_agent.py --collector dashboard-host:9401 --name <server name in server_info.json> [--interval 2]
+
+only needs the standard library, copy this file to the node and run it there
+protocol: one JSON object per line
+    {"type": "hello", "name": ..., "token": ...}
+    {"type": "full", "time": ..., "took": ..., "gpu": {index: row}, "apps": [row], "host": [row]}
+    {"type": "delta", "time": ..., "took": ..., "gpu": {index: row}, ...}   only the changed GPU rows / sections
+    {"type": "ping"}   when nothing changed for a while
+GPU rows are the nvidia-smi CSV without the timestamp column, the receiver adds the sample time
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import subprocess
+
+AGENT_FIELDS = "gpu_name,temperature.gpu,utilization.gpu,utilization.memory,memory.total,memory.free,memory.used,uuid"
+GPU_COMMAND = ["nvidia-smi", f"--query-gpu={AGENT_FIELDS}", "--format=csv,noheader,nounits"]
+APPS_COMMAND = ["nvidia-smi", "--query-compute-apps=gpu_uuid,pid,used_memory", "--format=csv,noheader,nounits"]
+PING_INTERVAL = 30  # seconds without changes before a ping is sent
+HOST_INTERVAL = 10  # the load average (and last pid) drifts on every sample, its changes are sent at most this often
+ENV = dict(os.environ, LC_ALL="C")  # free prints "Mem:" only in the C locale, a zh_CN host prints "内存："
+
+
+def _run(command: list[str]) -> list[str]:
+    result = subprocess.run(command, capture_output=True, text=True, timeout=30, check=True, env=ENV)
+    return [line.strip() for line in result.stdout.splitlines() if line.strip()]
+
+
+def _process_owner(pid: str) -> str:
+    try:
+        return _run(["ps", "-o", "user=", "-p", pid])[0]
+    except (subprocess.SubprocessError, IndexError, OSError):
+        return ""
+
+
+def sample(nvidia_smi: str = "nvidia-smi") -> dict:
+    """ one local sample: GPU rows by index, compute processes with their owner, host load """
+    gpu = _run([nvidia_smi, *GPU_COMMAND[1:]])
+    apps = []
+    for row in _run([nvidia_smi, *APPS_COMMAND[1:]]):
+        fields = [field.strip() for field in row.split(",")]
+        if len(fields) == 3 and fields[1].isdigit():
+            apps.append(f"{row}, {_process_owner(fields[1])}")
+    with open("/proc/loadavg") as f:
+        host = [f.read().strip()]
+    host.append(_run(["nproc"])[0])
+    host += [line for line in _run(["free", "-m"]) if line.startswith("Mem:")]
+    return {"gpu": {str(i): row for i, row in enumerate(gpu)}, "apps": apps, "host": host}
+
+
+def diff(previous: dict | None, current: dict) -> dict:
+    """ the parts of current that differ from previous """
+    if previous is None:
+        return current
+    changes = {}
+    gpu = {i: row for i, row in current["gpu"].items() if previous["gpu"].get(i) != row}
+    if gpu or len(current["gpu"]) != len(previous["gpu"]):
+        changes["gpu"] = gpu
+        changes["gpu_count"] = len(current["gpu"])
+    for section in ("apps", "host"):
+        if current[section] != previous[section]:
+            changes[section] = current[section]
+    return changes
+
+
+def run(collector: tuple[str, int], name: str, interval: float, token: str | None, nvidia_smi: str):
+    backoff = 1
+    while True:
+        try:
+            with socket.create_connection(collector, timeout=30) as sock:
+                print(f"Connected to {collector[0]}:{collector[1]} as {name}", file=sys.stderr)
+                send = lambda message: sock.sendall((json.dumps(message, separators=(",", ":")) + "\n").encode())
+                send({"type": "hello", "name": name, "token": token})
+                backoff = 1
+                previous, last_sent, host_sent = None, 0.0, 0.0
+                while True:
+                    start = time.time()
+                    current = sample(nvidia_smi)
+                    changes = diff(previous, current)
+                    if "host" in changes and previous is not None and start - host_sent < HOST_INTERVAL:
+                        del changes["host"]
+                        current["host"] = previous["host"]
+                    elif "host" in changes:
+                        host_sent = start
+                    if changes:
+                        send({"type": "full" if previous is None else "delta", "time": start, "took": time.time() - start, **changes})
+                        last_sent = start
+                    elif start - last_sent > PING_INTERVAL:
+                        send({"type": "ping"})
+                        last_sent = start
+                    previous = current
+                    time.sleep(max(0.0, interval - (time.time() - start)))
+        except (OSError, subprocess.SubprocessError) as e:
+            print(f"Agent error, reconnecting in {backoff}s: {e!r}", file=sys.stderr)
+            time.sleep(backoff)
+            backoff = min(60, backoff * 2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--collector", required=True, help="host:port of the collector's agent receiver")
+    parser.add_argument("--name", required=True, help="name of this server in server_info.json")
+    parser.add_argument("--interval", type=float, default=2, help="seconds between samples")
+    parser.add_argument("--token", default=None, help="shared secret, config.agent_token of the collector")
+    parser.add_argument("--nvidia-smi", default="nvidia-smi", help="path of nvidia-smi")
+    args = parser.parse_args()
+
+    host, _, port = args.collector.rpartition(":")
+    run((host, int(port)), args.name, args.interval, args.token, args.nvidia_smi)
@@ -0,0 +1,152 @@
+""" per-server GPU history, fixed size ring buffers in memory + downsampled append-only columnar files on disk """
+
+import os
+import re
+import time
+import threading
+from pathlib import Path
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: no lock, only one process may spill into a history_dir
+    fcntl = None
+
+from logger import logger
+
+# GPUSample attributes kept in the history, one float32 column per field
+HISTORY_FIELDS = ("utilization_gpu", "memory_percent", "temperature")
+
+
+class GPUHistory:
+    """
+    单个服务器的 GPU 历史数据
+    - 最近 capacity 个采样保存在预分配的环形缓冲区中，内存占用固定
+    - 被挤出环形缓冲区的采样每 downsample 个取平均，追加写入 spill_dir 下的列式文件，读取时用 memmap
+    """
+
+    def __init__(self, name: str, capacity: int = 3600, downsample: int = 10, spill_dir: str | Path | None = None):
+        self.name = name
+        self.capacity = capacity
+        self.downsample = downsample
+        self.spill_dir = Path(spill_dir) / re.sub(r"[^\w.-]", "_", name) if spill_dir is not None else None
+
+        self._lock = threading.Lock()
+        self.gpu_count = None
+        self._head = 0  # next slot to write
+        self._size = 0
+        self._time = None
+        self._values = None
+        self._evict_count = 0
+        self._evict_time = 0.0
+        self._evict_sum = None
+
+    def _allocate(self, gpu_count: int):
+        self.gpu_count = gpu_count
+        self._head = 0
+        self._size = 0
+        self._time = np.full(self.capacity, np.nan, dtype=np.float64)
+        self._values = {field: np.full((self.capacity, gpu_count), np.nan, dtype=np.float32) for field in HISTORY_FIELDS}
+        self._evict_count = 0
+        self._evict_time = 0.0
+        self._evict_sum = {field: np.zeros(gpu_count, dtype=np.float64) for field in HISTORY_FIELDS}
+
+    def _spill_path(self, field: str) -> Path:
+        # one directory per gpu count, so rows of every file always have the same width
+        return self.spill_dir / f"{self.gpu_count}gpu" / f"{field}.bin"
+
+    def _evict(self, slot: int):
+        """ 把即将被覆盖的采样累加到降采样块中，满一块就写入磁盘 """
+        if self.spill_dir is None:
+            return
+        self._evict_time += self._time[slot]
+        for field in HISTORY_FIELDS:
+            self._evict_sum[field] += self._values[field][slot]
+        self._evict_count += 1
+        if self._evict_count < self.downsample:
+            return
+
+        row = {"time": np.float64(self._evict_time / self._evict_count).tobytes()}
+        for field in HISTORY_FIELDS:
+            row[field] = (self._evict_sum[field] / self._evict_count).astype(np.float32).tobytes()
+        try:
+            self._append_row(row)
+        except OSError as e:
+            logger.warning(f"Failed to spill history of {self.name}: {e}")
+        self._evict_count = 0
+        self._evict_time = 0.0
+        for field in HISTORY_FIELDS:
+            self._evict_sum[field][:] = 0
+
+    def _append_row(self, row: dict[str, bytes]):
+        """ append one row to every column file, under a file lock shared by every process spilling into the same directory """
+        directory = self._spill_path("time").parent
+        directory.mkdir(parents=True, exist_ok=True)
+        with open(directory / ".lock", "ab") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)  # the dashboard and `python -m cli` may spill the same server at once
+            paths = {column: self._spill_path(column) for column in row}
+            sizes = {column: path.stat().st_size if path.exists() else 0 for column, path in paths.items()}
+            # cut a partial row left by a crash, so the rows of every file stay aligned
+            rows = min(sizes[column] // len(data) for column, data in row.items())
+            for column, data in row.items():
+                if sizes[column] > rows * len(data):
+                    os.truncate(paths[column], rows * len(data))
+                with open(paths[column], "ab") as f:
+                    f.write(data)
+
+    def append(self, sample, timestamp: float | None = None):
+        """ 记录一次采样，sample 为 gpu_parser.GPUSample """
+        timestamp = time.time() if timestamp is None else timestamp
+        with self._lock:
+            if self.gpu_count != len(sample):
+                self._allocate(len(sample))
+            slot = self._head
+            if self._size == self.capacity:
+                self._evict(slot)
+            else:
+                self._size += 1
+            self._time[slot] = timestamp
+            for field in HISTORY_FIELDS:
+                self._values[field][slot] = getattr(sample, field)
+            self._head = (slot + 1) % self.capacity
+
+    def _read_spilled(self, since: float) -> tuple[np.ndarray, dict]:
+        empty = np.empty(0, dtype=np.float64), {field: np.empty((0, self.gpu_count), dtype=np.float32) for field in HISTORY_FIELDS}
+        if self.spill_dir is None or not self._spill_path("time").exists():
+            return empty
+        try:
+            times = np.memmap(self._spill_path("time"), dtype=np.float64, mode="r")
+            columns = {field: np.memmap(self._spill_path(field), dtype=np.float32, mode="r") for field in HISTORY_FIELDS}
+        except (OSError, ValueError):
+            return empty
+        # a crash may leave a partially written last row, only keep rows present in every column
+        rows = min([len(times)] + [len(column) // self.gpu_count for column in columns.values()])
+        start = int(np.searchsorted(times[:rows], since))
+        return (np.array(times[start:rows]),
+                {field: np.array(column[start * self.gpu_count:rows * self.gpu_count]).reshape(-1, self.gpu_count)
+                 for field, column in columns.items()})
+
+    def query(self, since: float | None = None) -> tuple[np.ndarray, dict]:
+        """ 返回 since 之后的 (时间戳, {字段: [采样数, GPU 数]})，按时间升序，包括已写入磁盘的降采样数据 """
+        since = -np.inf if since is None else since
+        with self._lock:
+            if self.gpu_count is None:
+                return np.empty(0, dtype=np.float64), {field: np.empty((0, 0), dtype=np.float32) for field in HISTORY_FIELDS}
+            order = (np.arange(self._size) + self._head - self._size) % self.capacity
+            mask = self._time[order] >= since
+            order = order[mask]
+            times = self._time[order]
+            values = {field: self._values[field][order] for field in HISTORY_FIELDS}
+            spilled_times, spilled_values = self._read_spilled(since)
+
+        if len(spilled_times):
+            times = np.concatenate([spilled_times, times])
+            values = {field: np.concatenate([spilled_values[field], values[field]]) for field in HISTORY_FIELDS}
+        return times, values
+
+    def memory_bytes(self) -> int:
+        if self._time is None:
+            return 0
+        return self._time.nbytes + sum(column.nbytes for column in self._values.values())
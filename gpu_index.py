@@ -0,0 +1,95 @@
+""" fleet-wide index of free GPUs, answers "N free GPUs with at least M MiB on one server" without scanning every server """
+
+import bisect
+import threading
+from dataclasses import dataclass
+
+import numpy as np
+
+
+@dataclass
+class Placement:
+    """ 满足查询的一台服务器 """
+    server: str
+    model: str | None  # None when the query accepted any model
+    gpus: list[int]  # GPU indices on the server, most free memory first
+    free_memory: list[float]  # MiB, of those GPUs
+
+
+class FreeGPUIndex:
+    """
+    空闲 GPU 索引
+    - 利用率低于 max_util 的 GPU 视为空闲
+    - 对每个 (型号, k)，按服务器第 k 大的空闲显存排序，查询 k 张显存不少于 M 的 GPU 只需一次二分查找
+    - 每台服务器有新样本时只更新这台服务器的条目
+    """
+
+    def __init__(self, max_util: float = 10, max_count: int = 16):
+        self.max_util = max_util
+        self.max_count = max_count  # placements of more GPUs than this on one server are not indexed
+
+        self._lock = threading.Lock()
+        self._hosts = {}  # server -> {model or None: [(free MiB, gpu index), ...] most free first}
+        self._keys = {}  # (model or None, k) -> ascending [(k-th largest free MiB, server), ...]
+        self._samples = {}  # server -> the sample currently indexed
+
+    def update(self, server: str, sample):
+        """ 用服务器的最新 gpu_parser.GPUSample 替换它的条目 """
+        with self._lock:
+            if self._samples.get(server) is sample:
+                return
+            self._remove(server)
+            free = (sample.utilization_gpu < self.max_util) & np.isfinite(sample.memory_free)
+            groups = {None: []}
+            for i in np.flatnonzero(free).tolist():
+                entry = (float(sample.memory_free[i]), i)
+                groups[None].append(entry)
+                groups.setdefault(str(sample.gpu_name[i]), []).append(entry)
+            for model, gpus in groups.items():
+                gpus.sort(reverse=True)
+                for k, (free_mib, _) in enumerate(gpus[:self.max_count], start=1):
+                    bisect.insort(self._keys.setdefault((model, k), []), (free_mib, server))
+            self._hosts[server] = groups
+            self._samples[server] = sample
+
+    def remove(self, server: str):
+        """ 服务器不可达或被移除时，不再提供它的 GPU """
+        with self._lock:
+            self._remove(server)
+
+    def _remove(self, server: str):
+        groups = self._hosts.pop(server, None)
+        self._samples.pop(server, None)
+        if groups is None:
+            return
+        for model, gpus in groups.items():
+            for k, (free_mib, _) in enumerate(gpus[:self.max_count], start=1):
+                entries = self._keys[(model, k)]
+                del entries[bisect.bisect_left(entries, (free_mib, server))]
+                if not entries:
+                    del self._keys[(model, k)]
+
+    def find(self, count: int = 1, min_free_mib: float = 0, model: str | None = None, limit: int | None = None) -> list[Placement]:
+        """
+        有 count 张空闲显存不少于 min_free_mib 的 GPU（型号为 model，None 表示不限）的服务器
+        结果按第 count 大的空闲显存升序排列，最贴合需求的在前
+        """
+        with self._lock:
+            entries = self._keys.get((model, count), [])
+            start = bisect.bisect_left(entries, (min_free_mib, ""))
+            selected = entries[start:] if limit is None else entries[start:start + limit]
+            placements = []
+            for _, server in selected:
+                gpus = self._hosts[server][model][:count]
+                placements.append(Placement(server, model, [i for _, i in gpus], [free_mib for free_mib, _ in gpus]))
+            return placements
+
+    def models(self) -> list[str]:
+        """ 当前有空闲 GPU 的型号 """
+        with self._lock:
+            return sorted({model for model, k in self._keys if model is not None})
+
+    def free_count(self) -> int:
+        """ 整个集群的空闲 GPU 数 """
+        with self._lock:
+            return sum(len(groups[None]) for groups in self._hosts.values())
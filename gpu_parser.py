@@ -0,0 +1,161 @@
+""" parse `nvidia-smi --format=csv,noheader,nounits` output into typed numeric columns """
+
+from dataclasses import dataclass
+
+import numpy as np
+
+# order of the fields in the nvidia-smi query, see gpu_watcher.QUERY_FIELDS
+QUERY_COLUMNS = ("gpu_name", "timestamp", "temperature.gpu", "utilization.gpu", "utilization.memory",
+                 "memory.total", "memory.free", "memory.used", "uuid")
+# section markers printed by the multiplexed collection command, see gpu_watcher.COMMAND
+SECTION_MARKERS = {"@@gpu": "gpu", "@@apps": "apps", "@@host": "host"}
+
+
+@dataclass
+class GPUSample:
+    """ 一次采样中所有 GPU 的状态，每个字段是长度为 GPU 数的数组 """
+    gpu_name: np.ndarray  # str
+    timestamp: np.ndarray  # str, as printed by nvidia-smi
+    temperature: np.ndarray  # float, Celsius
+    utilization_gpu: np.ndarray  # float, %
+    utilization_memory: np.ndarray  # float, % of time the memory controller was busy
+    memory_total: np.ndarray  # float, MiB
+    memory_free: np.ndarray  # float, MiB
+    memory_used: np.ndarray  # float, MiB
+    uuid: np.ndarray  # str
+
+    def __len__(self) -> int:
+        return len(self.gpu_name)
+
+    def to_records(self) -> list[dict]:
+        """ 每个 GPU 一个 dict，NaN 转为 None，便于 JSON 序列化 """
+        def clean(value):
+            value = float(value)
+            return None if np.isnan(value) else value
+        return [{
+            "index": i,
+            "gpu_name": str(self.gpu_name[i]),
+            "timestamp": str(self.timestamp[i]),
+            "temperature": clean(self.temperature[i]),
+            "utilization_gpu": clean(self.utilization_gpu[i]),
+            "utilization_memory": clean(self.utilization_memory[i]),
+            "memory_total": clean(self.memory_total[i]),
+            "memory_free": clean(self.memory_free[i]),
+            "memory_used": clean(self.memory_used[i]),
+            "uuid": str(self.uuid[i]),
+        } for i in range(len(self))]
+
+    @property
+    def memory_percent(self) -> np.ndarray:
+        """ 显存占用百分比 """
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return self.memory_used / self.memory_total * 100
+
+
+def _parse_number(value: str) -> float:
+    try:
+        return float(value)
+    except ValueError:
+        return np.nan  # "[N/A]", "[Not Supported]" ...
+
+
+def _to_float(values: tuple[str, ...]) -> np.ndarray:
+    try:
+        return np.array(values, dtype=np.float64)
+    except ValueError:
+        return np.array([_parse_number(v) for v in values], dtype=np.float64)
+
+
+def parse_gpu_csv(text: str) -> GPUSample:
+    """ 解析 nvidia-smi 的 CSV 输出，列顺序必须与 QUERY_COLUMNS 一致，格式不对时抛出 ValueError """
+    rows = [line.split(",") for line in text.splitlines() if line.strip()]
+    if not rows:
+        raise ValueError("empty nvidia-smi output")
+    if any(len(row) != len(QUERY_COLUMNS) for row in rows):
+        raise ValueError(f"expected {len(QUERY_COLUMNS)} columns per row: {text!r}")
+
+    name, timestamp, temperature, util_gpu, util_mem, mem_total, mem_free, mem_used, uuid = zip(*rows)
+    return GPUSample(
+        gpu_name=np.array([v.strip() for v in name]),
+        timestamp=np.array([v.strip() for v in timestamp]),
+        temperature=_to_float(temperature),
+        utilization_gpu=_to_float(util_gpu),
+        utilization_memory=_to_float(util_mem),
+        memory_total=_to_float(mem_total),
+        memory_free=_to_float(mem_free),
+        memory_used=_to_float(mem_used),
+        uuid=np.array([v.strip() for v in uuid]),
+    )
+
+
+@dataclass
+class GPUProcesses:
+    """ 所有 GPU 上的计算进程，每个字段是长度为进程数的数组 """
+    gpu_index: np.ndarray  # int, index of the GPU in the GPUSample, -1 if the uuid is unknown
+    pid: np.ndarray  # int
+    used_memory: np.ndarray  # float, MiB
+    user: np.ndarray  # str, owner of the process, empty when `ps` could not resolve it
+
+    def __len__(self) -> int:
+        return len(self.pid)
+
+    def to_records(self) -> list[dict]:
+        return [{
+            "gpu_index": int(self.gpu_index[i]),
+            "pid": int(self.pid[i]),
+            "used_memory": None if np.isnan(self.used_memory[i]) else float(self.used_memory[i]),
+            "user": str(self.user[i]),
+        } for i in range(len(self))]
+
+
+def parse_apps_rows(rows: list[str], sample: GPUSample) -> GPUProcesses:
+    """ rows: "<gpu uuid>, <pid>, <used memory>, <user>" """
+    uuid_to_index = {uuid: i for i, uuid in enumerate(sample.uuid.tolist())}
+    gpu_index, pid, used_memory, user = [], [], [], []
+    for row in rows:
+        fields = [field.strip() for field in row.split(",")]
+        if len(fields) != 4 or not fields[1].isdigit():
+            continue  # e.g. "No running processes found"
+        gpu_index.append(uuid_to_index.get(fields[0], -1))
+        pid.append(int(fields[1]))
+        used_memory.append(_parse_number(fields[2]))
+        user.append(fields[3])
+    return GPUProcesses(
+        gpu_index=np.array(gpu_index, dtype=np.int32),
+        pid=np.array(pid, dtype=np.int64),
+        used_memory=np.array(used_memory, dtype=np.float64),
+        user=np.array(user, dtype=str),
+    )
+
+
+def parse_host_rows(rows: list[str]) -> dict:
+    """ rows: /proc/loadavg, nproc, the `Mem:` line of `free -m`; missing or broken lines are skipped """
+    host = {}
+    for row in rows:
+        fields = row.split()
+        try:
+            if row.startswith("Mem:"):
+                host["memory_total"], host["memory_used"] = float(fields[1]), float(fields[2])
+            elif len(fields) == 5 and "/" in fields[3]:
+                host["loadavg"] = [float(v) for v in fields[:3]]
+            elif len(fields) == 1:
+                host["cpus"] = int(fields[0])
+        except (ValueError, IndexError):
+            continue
+    return host
+
+
+def parse_collect_output(text: str) -> tuple[GPUSample, GPUProcesses, dict]:
+    """ 一次遍历解析多路复用命令的输出，返回 (GPU 状态, 进程列表, 主机负载) """
+    sections = {"gpu": [], "apps": [], "host": []}
+    current = None
+    for line in text.splitlines():
+        line = line.strip()
+        if line in SECTION_MARKERS:
+            current = SECTION_MARKERS[line]
+        elif line and current is not None:
+            sections[current].append(line)
+    if not sections["gpu"]:
+        raise ValueError(f"no GPU section in output: {text!r}")
+    sample = parse_gpu_csv("\n".join(sections["gpu"]))
+    return sample, parse_apps_rows(sections["apps"], sample), parse_host_rows(sections["host"])
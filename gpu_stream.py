@@ -0,0 +1,46 @@
+""" incremental parser for `nvidia-smi --loop-ms` output read from a long-lived SSH channel """
+
+import codecs
+
+
+class GPUStreamParser:
+    """ 增量解析 CSV 数据块，并按采样轮次组帧 """
+
+    def __init__(self):
+        self.expected_rows = None  # learned from the first complete frame
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._buffer = ""
+        self._frame = []
+        self._last_index = -1
+
+    def feed(self, data: bytes) -> list[list[str]]:
+        """
+        喂入一段原始输出，返回其中已完整的帧，每帧是一次采样的所有 GPU 行（已去掉 index 列）
+        - 每行以 GPU index 开头，index 回绕或行数达到 GPU 数时视为一帧结束
+        - 输出无法解析时抛出 ValueError
+        """
+        frames = []
+        self._buffer += self._decoder.decode(data)
+        *lines, self._buffer = self._buffer.split("\n")
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            index_str, _, row = line.partition(",")
+            try:
+                index = int(index_str)
+            except ValueError:
+                raise ValueError(f"unexpected stream output: {line}")
+
+            if self._frame and index <= self._last_index:
+                # index wrapped around before we knew the gpu count
+                self.expected_rows = len(self._frame)
+                frames.append(self._frame)
+                self._frame = []
+            self._frame.append(row.strip())
+            self._last_index = index
+            if self.expected_rows is not None and len(self._frame) == self.expected_rows:
+                frames.append(self._frame)
+                self._frame = []
+                self._last_index = -1
+        return frames
@@ -1,39 +1,148 @@
-import io
 import time
-import csv
-import paramiko
-import threading
-from paramiko import SSHClient, AutoAddPolicy
-import streamlit as st
-import pandas as pd
+import socket
+from dataclasses import dataclass, replace
+from typing import Any
+
+import numpy as np
 
 import config
 from i18n_service import i18n
 from logger import logger
 from exec_hook import ExtractException
-from ding_notify import ding_print_txt
+from notify_dispatcher import notifier
+from ssh_pool import ssh_pool, SSHTarget
+from poll_engine import poll_engine
+from gpu_parser import parse_gpu_csv, parse_collect_output
+from gpu_history import GPUHistory
+from fleet_table import summarize_blocks
+from adaptive_schedule import adaptive_scheduler
+from alert_rules import AlertRule, alert_engine, RESERVED_PREFIX
+from metrics import metrics
 # language service
-COMMAND = "nvidia-smi --query-gpu=gpu_name,timestamp,temperature.gpu,utilization.gpu,utilization.memory,memory.total,memory.free,memory.used --format=csv"
+QUERY_FIELDS = "gpu_name,timestamp,temperature.gpu,utilization.gpu,utilization.memory,memory.total,memory.free,memory.used,uuid"
+GPU_COMMAND = f"nvidia-smi --query-gpu={QUERY_FIELDS} --format=csv,noheader,nounits"
+# "<gpu uuid>, <pid>, <used memory>, <owner>" for every compute process
+APPS_COMMAND = ("nvidia-smi --query-compute-apps=gpu_uuid,pid,used_memory --format=csv,noheader,nounits"
+                " | while IFS=\", \" read -r uuid pid mem; do echo \"$uuid, $pid, $mem, $(ps -o user= -p $pid)\"; done")
+HOST_COMMAND = "cat /proc/loadavg; nproc; free -m | grep Mem:"
+# one remote invocation per poll, sections are framed by marker lines and parsed by gpu_parser.parse_collect_output
+# wrapped in `sh -c` so it does not depend on the login shell of the remote user, LC_ALL=C keeps `free` printing "Mem:"
+COMMAND = f"sh -c 'export LC_ALL=C; echo @@gpu; {GPU_COMMAND}; echo @@apps; {APPS_COMMAND}; echo @@host; {HOST_COMMAND}'"
+# streaming mode, `index` is prepended so the reader can split the rows into samples
+STREAM_COMMAND = f"nvidia-smi --query-gpu=index,{QUERY_FIELDS} --format=csv,noheader,nounits --loop-ms={{}}"
 SSH_STATUS_LUT = {
     "success": 0,
     "loading": 1,
     "error": -1,
 }
 FREE_PERSETNAGE = 1  # 1%  free GPU memory and utilization percentage to be considered as free
+ONE_BLOCK = np.zeros(1, dtype=np.intp)  # summarize_blocks over a single server
+# the reminders of the page as alert rules, enabled per server by remind_config, both fire on the busy -> free transition
+FREE_CONDITION = f"utilization_gpu < {FREE_PERSETNAGE} and memory_percent < {FREE_PERSETNAGE}"
+# named under RESERVED_PREFIX, so rules of alert_rules.json cannot replace them
+REMINDER_RULES = {
+    "remind_if_have_free": AlertRule(f"{RESERVED_PREFIX}have_free", FREE_CONDITION, min_gpus=1, edge=True, opt_in=True),
+    "remind_if_all_free": AlertRule(f"{RESERVED_PREFIX}all_free", FREE_CONDITION, min_gpus=None, edge=True, opt_in=True),
+}
+# server_info.json fields stored in the SSH target, and those of them that need a new connection when edited
+TARGET_FIELDS = {"ip", "port", "username", "password", "connect_timeout", "auth_timeout", "banner_timeout",
+                 "command_timeout", "key_filename", "gateway"}
+CONNECTION_FIELDS = {"ip", "port", "username", "password", "key_filename", "gateway"}
+REMINDER_TEXT = {f"{RESERVED_PREFIX}have_free": "have_free_remind", f"{RESERVED_PREFIX}all_free": "all_free_remind"}
+alert_engine.add_rules(REMINDER_RULES.values())
+
+
+@dataclass(frozen=True)
+class WatcherSnapshot:
+    """ watcher 状态的只读快照，每次状态变化时整体替换，读者无需加锁 """
+    name: str
+    message: str
+    ssh_state: int
+    gpu_state: Any  # gpu_parser.GPUSample or None
+    summerized_gpu_state: dict | None
+    process_state: Any  # gpu_parser.GPUProcesses or None
+    host_state: dict | None
+    poll_latency: float | None
+    stale: bool  # the data is older than the last refresh the user asked for
+    restored_at: float | None  # sample time of data restored from the checkpoint, None once the server answered
+    seq: int  # increased on every published state
+    updated_at: float
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "message": self.message,
+            "ssh_state": self.ssh_state,
+            "seq": self.seq,
+            "updated_at": self.updated_at,
+            "poll_latency": self.poll_latency,
+            "stale": self.stale,
+            "restored_at": self.restored_at,
+            "summary": self.summerized_gpu_state,
+            "gpus": self.gpu_state.to_records() if self.gpu_state is not None else None,
+            "processes": self.process_state.to_records() if self.process_state is not None else None,
+            "host": self.host_state,
+        }
+
+
+class _Query:
+    """ 进行中的一次 SSH 查询，stop_run 关闭它当前阻塞在上面的 socket / channel 来中断 """
+
+    def __init__(self):
+        self.aborted = False
+        self.channel = None
+
+    def set_channel(self, channel):
+        self.channel = channel
+        if self.aborted and channel is not None:  # aborted before this stage started
+            self._close(channel)
+
+    def abort(self):
+        self.aborted = True
+        channel = self.channel
+        if channel is not None:
+            self._close(channel)
+
+    @staticmethod
+    def _close(channel):
+        if isinstance(channel, socket.socket):
+            try:
+                channel.shutdown(socket.SHUT_RDWR)  # also ends a connect() still waiting for the SYN-ACK
+            except OSError:
+                pass
+        channel.close()
+
 
 class SingleGPUServerWatcher:
-    def __init__(self, name: str, ip: str, username: str,password: str | None = None, port: int = 22, update_step: int = 10):
+    def __init__(self, name: str, ip: str, username: str,password: str | None = None, port: int = 22, update_step: int = 10,
+                 stream: bool = False, stream_interval_ms: int = 1000,
+                 connect_timeout: float = config.ssh_connect_timeout, auth_timeout: float = config.ssh_auth_timeout,
+                 banner_timeout: float = config.ssh_banner_timeout, command_timeout: float = config.ssh_command_timeout,
+                 key_filename: str | None = None, gateway: SSHTarget | None = None, source: str = "ssh"):
         self.name = name
         self.ip = ip
         self.username = username
         self.password = password
         self.port = port
         self.update_step = update_step
+        self.stream = stream  # use `nvidia-smi --loop-ms` over one channel while loop watching
+        self.stream_interval_ms = stream_interval_ms
+        self.source = source  # "ssh": polled by the poll engine, "agent": pushed by gpu_agent.py to the agent receiver
+        self.target = SSHTarget(ip, port, username, password, connect_timeout=connect_timeout, auth_timeout=auth_timeout,
+                                banner_timeout=banner_timeout, command_timeout=command_timeout,
+                                key_filename=key_filename, gateway=gateway, name=name)
 
-        self.message = ""
-        self.gpu_state = None # gpu state dataframe
+        self.message = i18n.get_text("agent_waiting") if source == "agent" else ""
+        self.gpu_state = None # gpu state, a gpu_parser.GPUSample
         self.ssh_state = SSH_STATUS_LUT["loading"]  # ssh connection state
         self.summerized_gpu_state = None
+        self.process_state = None  # compute processes, a gpu_parser.GPUProcesses
+        self.host_state = None  # host load, {"loadavg", "cpus", "memory_total", "memory_used"}
+        self.poll_latency = None  # seconds spent on the last ssh query
+        self.stale = False
+        self.restored_at = None
+        self.history = GPUHistory(name, capacity=config.history_capacity,
+                                  downsample=config.history_downsample, spill_dir=config.history_dir)
 
         self.is_looping = False # if the watcher is running in a looping watch mode
         self.remind_config = {
@@ -41,194 +150,305 @@ class SingleGPUServerWatcher:
             "remind_if_have_free": False,
             "remind_every_update": False,
         }
-        self.remind_state = {
-            "have_from_busy_to_free": False,
-            "all_from_busy_to_free": False,
-        }
 
-        self.running = threading.Event()
-        self.thread = None
+        self.task = None  # poll_engine.PollTask of the job scheduled on the poll engine
+        self._query = None  # _Query in flight, aborted by stop_run
+
+        self.seq = 0
+        self.snapshot = None
+        self.last_good = None  # latest snapshot with GPU data, what the checkpoint saves
+        self.listeners = []  # called with every new snapshot, from the poll threads
+        self._publish()
 
-    def is_valid_csv(self, data):
+    def _publish(self):
+        """ publish the current state as a new snapshot for readers in other threads / sessions """
+        self.seq += 1
+        self.snapshot = WatcherSnapshot(
+            name=self.name,
+            message=self.message,
+            ssh_state=self.ssh_state,
+            gpu_state=self.gpu_state if self.ssh_state == SSH_STATUS_LUT["success"] else None,
+            summerized_gpu_state=self.summerized_gpu_state,
+            process_state=self.process_state if self.ssh_state == SSH_STATUS_LUT["success"] else None,
+            host_state=self.host_state,
+            poll_latency=self.poll_latency,
+            stale=self.stale,
+            restored_at=self.restored_at,
+            seq=self.seq,
+            updated_at=time.time(),
+        )
+        if self.snapshot.gpu_state is not None:
+            self.last_good = self.snapshot
+        for listener in self.listeners:
+            listener(self.snapshot)
+
+    def update_gpu_state(self, result, multiplexed=True):
+        """ multiplexed: output of COMMAND, otherwise plain GPU rows (stream mode keeps the last processes / host load) """
         try:
-            csv.reader(io.StringIO(data))
-            return True
-        except csv.Error:
-            return False
+            with metrics.timer("parse", self.name):
+                if multiplexed:
+                    sample, self.process_state, self.host_state = parse_collect_output(result)
+                else:
+                    sample = parse_gpu_csv(result)
+        except ValueError as e:
+            self.message = i18n.get_text("invalid_output_message").format(result)
+            self.ssh_state = SSH_STATUS_LUT["error"]
+            logger.error(f"{self.message} ({e})")
+            self.gpu_state = None
+            self.summerized_gpu_state = None
+            self._publish()
+            return
+        self.gpu_state = sample
+        self.history.append(sample)
+        self.remind_through_dingding()
+        self.message = i18n.get_text("success_message")
+        self.ssh_state = SSH_STATUS_LUT["success"]
+        self.stale = False
+        self.restored_at = None
+        self._publish()
 
-    def convert_gpu_info_to_dataframe(self, info):
-        state = pd.read_csv(io.StringIO(info))
-        logger.debug(f"Parsed DataFrame:\n{state}")
-
-        state.columns = [col.strip() for col in state.columns]
-
-        column_mapping = {
-            'name': 'gpu_name',
-            'timestamp': 'timestamp',
-            'temperature.gpu': 'temperature.gpu',
-            'utilization.gpu [%]': 'utilization.gpu',
-            'utilization.memory [%]': 'utilization.memory',
-            'memory.total [MiB]': 'memory.total',
-            'memory.used [MiB]': 'memory.used',
-            'memory.free [MiB]': 'memory.free'
+    def checkpoint_state(self) -> dict | None:
+        """ what checkpoint.py saves: the last GPU data and the reminder settings / state """
+        snapshot = self.last_good
+        if snapshot is None:
+            return None
+        return {
+            "gpu_state": snapshot.gpu_state,
+            "summerized_gpu_state": snapshot.summerized_gpu_state,
+            "process_state": snapshot.process_state,
+            "host_state": snapshot.host_state,
+            "sampled_at": snapshot.restored_at or snapshot.updated_at,
+            "remind_config": dict(self.remind_config),
+            "alert_state": alert_engine.get_state(self.name),
+            "is_looping": self.is_looping,
         }
 
-        actual_columns = state.columns
-        for actual_col, expected_col in column_mapping.items():
-            if actual_col in actual_columns:
-                state.rename(columns={actual_col: expected_col}, inplace=True)
-            else:
-                logger.warning(f"Column '{actual_col}' not found in the output. Skipping...")
-
-        # check column existence
-        required_columns = ['gpu_name', 'timestamp', 'temperature.gpu', 'utilization.gpu', 'utilization.memory', 'memory.total', 'memory.used', 'memory.free']
-        if not all(col in state.columns for col in required_columns):
-            missing_columns = [col for col in required_columns if col not in state.columns]
-            raise ValueError(f"Missing required columns: {missing_columns}")
-
-        # convert columns to appropriate types
-        state['memory.total'] = state['memory.total'].str.rstrip(' MiB').astype(int)
-        state['memory.used'] = state['memory.used'].str.rstrip(' MiB').astype(int)
-        state['memory'] = state.apply(lambda row: f"{row['memory.used']} MiB / {row['memory.total']} MiB", axis=1)
-        state['utilization.memory'] = state.apply(lambda row: f"{row['memory.used'] / row['memory.total'] * 100:.2f} %", axis=1)
-        state.drop(columns=['memory.total', 'memory.free', 'memory.used'], inplace=True)
-        return state
+    def restore_checkpoint(self, state: dict):
+        """ show the saved data as stale until the server answers, reminders continue from the saved state """
+        self.gpu_state = state["gpu_state"]
+        self.summerized_gpu_state = state["summerized_gpu_state"]
+        self.process_state = state["process_state"]
+        self.host_state = state["host_state"]
+        self.remind_config.update(state["remind_config"])
+        alert_engine.restore_state(self.name, state.get("alert_state", {}))
+        self.is_looping = state["is_looping"]
+        self.message = i18n.get_text("success_message")
+        self.ssh_state = SSH_STATUS_LUT["success"]
+        self.stale = True
+        self.restored_at = state["sampled_at"]
+        self._publish()
+
+    def mark_stale(self):
+        """ keep showing the last state, flagged as outdated """
+        self.stale = True
+        self._publish()
+
+    def abort_query(self):
+        """ close what the query in flight is blocked on (connect, banner, auth, tunnel or read) so it returns immediately """
+        query = self._query
+        if query is not None:
+            query.abort()
+
+    def _restore_after_abort(self, message, ssh_state):
+        logger.info(f"Query of {self.name} aborted")
+        self.message, self.ssh_state = message, ssh_state
+        self._publish()
+
+    def update_agent_sample(self, result, took=None):
+        """ a sample pushed by the agent, result in the format of COMMAND """
+        self.poll_latency = took  # time the agent spent on nvidia-smi
+        if took is not None:
+            metrics.observe("poll", took, self.name)
+        logger.info(f"'{self.name}' -- Received agent sample: {result}")
+        self.update_gpu_state(result)
+
+    def set_agent_disconnected(self, reason):
+        self.message = i18n.get_text("agent_disconnected").format(reason)
+        self.ssh_state = SSH_STATUS_LUT["error"]
+        logger.error(f"{self.name}: {self.message}")
+        self._publish()
 
     def get_gpu_info(self):
+        if self.source == "agent":
+            return  # nothing to query, the agent pushes every change
+        import paramiko  # already loaded by ssh_pool, only needed for the exception types
+
+        previous = (self.message, self.ssh_state)
         self.message = i18n.get_text("loading_message")
         self.ssh_state = SSH_STATUS_LUT["loading"]
+        query = self._query = _Query()  # its own abort state, a restarted watch may query while this one winds down
+        self._publish()
         try:
-            ssh = SSHClient()
-            ssh.set_missing_host_key_policy(AutoAddPolicy())
-            ssh.connect(self.ip, port=self.port, username=self.username, password=self.password)
-            stdin, stdout, stderr = ssh.exec_command(COMMAND)
-            result = stdout.read().decode('utf-8')
-            ssh.close()
-
-            logger.info(f"'{self.name}' -- Received output: {result}")
-
-            if self.is_valid_csv(result):
-                self.message = i18n.get_text("success_message")
-                self.ssh_state = SSH_STATUS_LUT["success"]
-                self.gpu_state = self.convert_gpu_info_to_dataframe(result)
-                self.remind_through_dingding()
-            else:
-                self.message = i18n.get_text("invalid_output_message").format(result)
-                self.ssh_state = SSH_STATUS_LUT["error"]
-                logger.error(self.message)
-                self.gpu_state = None
-                self.summerized_gpu_state = None
+            start = time.perf_counter()
+            try:
+                result = ssh_pool.exec_command(self.target, COMMAND, on_channel=query.set_channel,
+                                               is_aborted=lambda: query.aborted)
+            except Exception:
+                if not query.aborted:
+                    raise
+            finally:
+                if self._query is query:
+                    self._query = None
+            if query.aborted:
+                self._restore_after_abort(*previous)
+                return
+            self.poll_latency = time.perf_counter() - start
+            metrics.observe("poll", self.poll_latency, self.name)
+
+            logger.info(f"'{self.name}' -- Received output in {self.poll_latency:.3f}s: {result}")
+            self.update_gpu_state(result)
 
         except paramiko.AuthenticationException:
             self.message = i18n.get_text("ssh_authentication_error")
             self.ssh_state = SSH_STATUS_LUT["error"]
             logger.error(self.message)
-        except paramiko.SSHException as e:
+            self._publish()
+        except TimeoutError as e:  # also socket.timeout from connect / banner / auth
+            self.message = i18n.get_text("ssh_timeout_error").format(e)
+            self.ssh_state = SSH_STATUS_LUT["error"]
+            logger.error(f"{self.name}: {self.message}")
+            self._publish()
+        except (paramiko.SSHException, OSError, EOFError) as e:
             self.message = i18n.get_text("ssh_connection_error").format(e)
             self.ssh_state = SSH_STATUS_LUT["error"]
             logger.error(self.message)
+            self._publish()
         except Exception as e:
             err_stack = ExtractException(type(e), e, e.__traceback__, panel=False)
+            self.message = i18n.get_text("display_error")
             self.ssh_state = SSH_STATUS_LUT["error"]
             logger.error(f"Error while getting GPU info for {self.name}: {err_stack}")
             self.gpu_state = i18n.get_text("display_error")
             self.summerized_gpu_state = None
+            self._publish()
 
     def summerize_gpu_state(self):
-        # extract the GPU name and utilization from the dataframe, check if the GPU is free
-        def convert_set_to_str(s):
-            return ", ".join(sorted(s))
-        gpu_util_list = self.gpu_state['utilization.gpu'].str.rstrip('%').astype(float)
-        memory_util_list = self.gpu_state['utilization.memory'].str.rstrip('%').astype(float)
-        max_gpu_util = gpu_util_list.max()
-        max_gpu_memory = memory_util_list.max()
-        min_gpu_util = gpu_util_list.min()
-        min_gpu_memory = memory_util_list.min()
+        # the same grouped reductions as the fleet table (fleet_table.GPUStateTable), over this server only
+        summary = summarize_blocks(self.gpu_state.utilization_gpu, self.gpu_state.memory_percent, ONE_BLOCK, FREE_PERSETNAGE)
         return {
-            "gpu_name": convert_set_to_str(set(self.gpu_state["gpu_name"])),
-            "avg_gpu_util": gpu_util_list.mean(),
-            "avg_memory_util": memory_util_list.mean(),
-            "all_free": max_gpu_util < FREE_PERSETNAGE and max_gpu_memory < FREE_PERSETNAGE,
-            "have_free": min_gpu_util < FREE_PERSETNAGE and min_gpu_memory < FREE_PERSETNAGE,
-            "dead_process": min_gpu_memory > 0 and max_gpu_util < FREE_PERSETNAGE,
+            "gpu_name": ", ".join(sorted(set(self.gpu_state.gpu_name.tolist()))),
+            "avg_gpu_util": float(summary["avg_gpu_util"][0]),
+            "avg_memory_util": float(summary["avg_memory_util"][0]),
+            "all_free": bool(summary["all_free"][0]),
+            "have_free": bool(summary["have_free"][0]),
+            "dead_process": bool(summary["dead_process"][0]),
+            "users": sorted(set(self.process_state.user.tolist()) - {""}) if self.process_state is not None else [],
         }
 
     def remind_through_dingding(self):
-        new_summerized_gpu_state = self.summerize_gpu_state()
-        if self.summerized_gpu_state is not None:
-            self.remind_state['all_from_busy_to_free'] = not self.summerized_gpu_state['all_free'] and new_summerized_gpu_state['all_free']
-            self.remind_state['have_from_busy_to_free'] = not self.summerized_gpu_state['have_free'] and new_summerized_gpu_state['have_free']
-
-        if self.remind_config["remind_if_have_free"] and (self.remind_state['have_from_busy_to_free'] or (new_summerized_gpu_state['have_free'] and self.remind_config["remind_every_update"])):
-            self.send_have_empty_remind()
-        elif self.remind_config["remind_if_all_free"] and (self.remind_state['all_from_busy_to_free'] or (new_summerized_gpu_state['all_free'] and self.remind_config["remind_every_update"])):
-            self.send_all_empty_remind()
-
-        self.summerized_gpu_state = new_summerized_gpu_state
-
-    def send_all_empty_remind(self):
-        logger.info(f"Send all free remind for {self.name}")
-        error = ding_print_txt(i18n.get_text("all_free_remind").format(self.name))
-        if error is not None:
-            st.session_state["dingAvailable"] = False
-        else:
-            st.session_state["dingAvailable"] = True
+        with metrics.timer("summarize", self.name):
+            self.summerized_gpu_state = self.summerize_gpu_state()
+        enabled = frozenset(rule.name for key, rule in REMINDER_RULES.items() if self.remind_config[key])
+        repeat = enabled if self.remind_config["remind_every_update"] else frozenset()
+        with metrics.timer("alerts", self.name):
+            alerts = alert_engine.evaluate(self.name, self.gpu_state, opt_in=enabled, repeat=repeat)
+        for alert in alerts:
+            self.send_alert(alert)
 
-    def send_have_empty_remind(self):
-        logger.info(f"Send have free remind for {self.name}")
-        error = ding_print_txt(i18n.get_text("have_free_remind").format(self.name))
-        if error is not None:
-            st.session_state["dingAvailable"] = False
+    def send_alert(self, alert):
+        rule = alert.rule
+        key = f"{rule.name}:{self.name}"
+        if alert.resolved:
+            key += ":resolved"  # its own dedup key, a quick recovery is not a duplicate of the firing
+            text = i18n.get_text("alert_resolved").format(server=self.name, rule=rule.name, count=alert.count)
+        elif rule.name in REMINDER_TEXT:
+            text = i18n.get_text(REMINDER_TEXT[rule.name]).format(self.name)
         else:
-            st.session_state["dingAvailable"] = True
+            try:
+                text = (rule.message or i18n.get_text("alert_remind")).format(server=self.name, rule=rule.name, count=alert.count)
+            except (KeyError, IndexError, ValueError) as e:  # rules added without from_dict are not checked
+                logger.error(f"Invalid message of alert rule {rule.name}: {e!r}")
+                text = i18n.get_text("alert_remind").format(server=self.name, rule=rule.name, count=alert.count)
+        logger.info(f"Send alert {rule.name} for {self.name}")
+        notifier.notify(key, text)
+
+    def waiting_for_free(self) -> bool:
+        """ a busy-to-free reminder is enabled and has not fired yet """
+        summary = self.summerized_gpu_state
+        if summary is None:
+            return False
+        return ((self.remind_config["remind_if_have_free"] and not summary["have_free"])
+                or (self.remind_config["remind_if_all_free"] and not summary["all_free"]))
+
+    def next_poll_interval(self) -> float:
+        """ seconds to wait before the next poll of the loop watch """
+        if not config.adaptive_polling:
+            return self.update_step
+        reachable = self.ssh_state == SSH_STATUS_LUT["success"]
+        return adaptive_scheduler.next_interval(self.name, self.gpu_state if reachable else None, reachable,
+                                                self.waiting_for_free(), default=self.update_step)
+
     def set_update_step(self, update_step):
         logger.info(f"Set update step for {self.name} to {update_step}")
         self.update_step = update_step
-        if self.thread is not None:
-            self.restart_run(loop=True)
+        adaptive_scheduler.reset(self.name, update_step)
+        if self.is_looping and self.task is not None and not self.task.done():
+            self.task.wake()  # the next poll starts now and then waits the new update_step
         else:
             self.start_run(loop=True)
 
-    def update_loop(self):
-        while self.running.is_set():
-            self.get_gpu_info()
-            logger.info(f"Updated GPU info for {self.name}")
-            time.sleep(self.update_step)
+    def open_stream(self):
+        """ start `nvidia-smi --loop-ms` on a pooled channel, rows are read by the poll engine """
+        return ssh_pool.open_channel(self.target, STREAM_COMMAND.format(self.stream_interval_ms))
 
-    def update_once(self):
-        if self.running.is_set():
-            self.get_gpu_info()
-            logger.info(f"Updated GPU info for {self.name}")
-            self.running.clear()
-            self.thread = None
+    def update_stream_frame(self, rows):
+        logger.debug(f"'{self.name}' -- Received stream frame: {rows}")
+        self.update_gpu_state("\n".join(rows), multiplexed=False)
+
+    def set_timeout_state(self, timeout):
+        self.message = i18n.get_text("poll_timeout").format(timeout)
+        self.ssh_state = SSH_STATUS_LUT["error"]
+        logger.error(f"{self.name}: {self.message}")
+        self._publish()
 
     def start_run(self, loop=False):
-        if self.thread is not None:
-            logger.info(f"{self.name} is already running, stopping the old thread")
+        if self.task is not None:
+            logger.info(f"{self.name} is already running, stopping the old task")
             self.stop_run()
 
         if loop:
-            target_func = self.update_loop
             self.is_looping = True
-        else:
-            target_func = self.update_once
-
-        self.running.set()
-        self.thread = threading.Thread(target=target_func)
-        self.thread.daemon = True
-        self.thread.start()
+        if self.source == "agent":
+            return  # updated by the agent receiver
+        self.task = poll_engine.schedule(self, loop=loop)
         logger.info(f"Started watching {self.name}")
 
     def stop_run(self):
-        if self.thread is not None:
-            self.running.clear()
-            self.thread.join()
-            self.thread = None
+        if self.task is not None:
+            self.abort_query()
+            if not self.task.cancel(config.stop_timeout):
+                logger.warning(f"Watch task of {self.name} did not exit within {config.stop_timeout}s")
+            self.task = None
+            adaptive_scheduler.forget(self.name)
             logger.info(f"Stopped watching {self.name}")
         else:
             logger.info(f"{self.name} is not running")
         self.is_looping = False
 
+    def reconfigure(self, **changes):
+        """ apply edited server_info.json fields in place, the history and reminders are kept (the collector closes unused connections) """
+        logger.info(f"Reconfigure {self.name}: {sorted(changes)}")
+        restart = False
+        target_changes = {key: value for key, value in changes.items() if key in TARGET_FIELDS}
+        if target_changes:
+            for key in ("ip", "port", "username", "password"):
+                if key in changes:
+                    setattr(self, key, changes[key])
+            self.target = replace(self.target, **target_changes)
+            restart = bool(changes.keys() & CONNECTION_FIELDS)
+        for key in ("stream", "stream_interval_ms", "source"):
+            if key in changes:
+                setattr(self, key, changes[key])
+                restart = True
+        if "update_step" in changes:
+            if self.is_looping and not restart:
+                self.set_update_step(changes["update_step"])
+            else:
+                self.update_step = changes["update_step"]
+                adaptive_scheduler.reset(self.name, self.update_step)
+        if restart and (self.task is not None or self.is_looping):
+            self.restart_run(loop=self.is_looping)
+
     def restart_run(self, loop=False):
         self.stop_run()
-        self.start_run(loop=loop)
\ No newline at end of file
+        self.start_run(loop=loop)
@@ -0,0 +1,201 @@
+""" HTTP endpoint serving the collected GPU state as JSON, in the Prometheus text format and as a stream of server-sent events """
+
+import json
+import math
+import hashlib
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import config
+from gpu_watcher import SSH_STATUS_LUT
+from metrics import metrics, BUCKETS
+from ssh_pool import ssh_pool
+from notify_dispatcher import notifier
+from logger import logger
+
+
+def _json_safe(value):
+    """ NaN / inf are not valid JSON, replace them with null """
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    if isinstance(value, dict):
+        return {k: _json_safe(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_json_safe(v) for v in value]
+    return value
+
+
+def _label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _metric_value(value) -> str:
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return "NaN"
+    return repr(float(value))
+
+
+def render_json(snapshots: dict) -> bytes:
+    data = {"servers": {name: _json_safe(snapshot.to_dict()) for name, snapshot in snapshots.items()}}
+    return json.dumps(data, ensure_ascii=False).encode("utf-8")
+
+
+# (metric name, help, GPUSample attribute)
+GPU_METRICS = (
+    ("gpu_utilization_percent", "GPU utilization in percent", "utilization_gpu"),
+    ("gpu_memory_utilization_percent", "Memory controller utilization in percent", "utilization_memory"),
+    ("gpu_memory_used_mib", "Used GPU memory in MiB", "memory_used"),
+    ("gpu_memory_total_mib", "Total GPU memory in MiB", "memory_total"),
+    ("gpu_temperature_celsius", "GPU temperature in Celsius", "temperature"),
+)
+
+
+def render_prometheus(snapshots: dict) -> bytes:
+    lines = [
+        "# HELP gpu_server_up Whether the last query of the server succeeded",
+        "# TYPE gpu_server_up gauge",
+    ]
+    for name, snapshot in snapshots.items():
+        lines.append(f'gpu_server_up{{server="{_label(name)}"}} {int(snapshot.ssh_state == SSH_STATUS_LUT["success"])}')
+
+    lines += [
+        "# HELP gpu_server_poll_latency_seconds Duration of the last query of the server",
+        "# TYPE gpu_server_poll_latency_seconds gauge",
+    ]
+    for name, snapshot in snapshots.items():
+        if snapshot.poll_latency is not None:
+            lines.append(f'gpu_server_poll_latency_seconds{{server="{_label(name)}"}} {_metric_value(snapshot.poll_latency)}')
+
+    for key in ("all_free", "have_free"):
+        lines += [
+            f"# HELP gpu_server_{key} Value of the '{key}' summary of the server",
+            f"# TYPE gpu_server_{key} gauge",
+        ]
+        for name, snapshot in snapshots.items():
+            if snapshot.summerized_gpu_state is not None:
+                lines.append(f'gpu_server_{key}{{server="{_label(name)}"}} {int(snapshot.summerized_gpu_state[key])}')
+
+    for metric, help_text, attr in GPU_METRICS:
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} gauge"]
+        for name, snapshot in snapshots.items():
+            sample = snapshot.gpu_state
+            if sample is None:
+                continue
+            for i, value in enumerate(getattr(sample, attr)):
+                lines.append(f'{metric}{{server="{_label(name)}",gpu="{i}",gpu_name="{_label(sample.gpu_name[i])}"}} {_metric_value(value)}')
+    lines += render_self_metrics()
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def render_self_metrics() -> list[str]:
+    """ stage histograms of metrics.py plus the counters of the SSH pool and the notification dispatcher """
+    lines = []
+    for key, value in ssh_pool.get_stats().items():
+        if key == "alive":
+            lines += ["# TYPE gpu_collector_ssh_alive gauge", f"gpu_collector_ssh_alive {value}"]
+        else:
+            lines += [f"# TYPE gpu_collector_ssh_{key}_total counter", f"gpu_collector_ssh_{key}_total {value}"]
+    for key, value in notifier.stats.items():
+        lines += [f"# TYPE gpu_collector_notifications_{key}_total counter", f"gpu_collector_notifications_{key}_total {value}"]
+
+    histograms = metrics.histograms()
+    if not histograms:
+        return lines
+    lines += [
+        "# HELP gpu_collector_stage_seconds Duration of each stage of a poll",
+        "# TYPE gpu_collector_stage_seconds histogram",
+    ]
+    for (stage, server), (counts, total, count) in sorted(histograms.items()):
+        labels = f'stage="{stage}",server="{_label(server)}"'
+        cumulative = 0
+        for bound, n in zip((*BUCKETS, "+Inf"), counts):
+            cumulative += n
+            lines.append(f'gpu_collector_stage_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f"gpu_collector_stage_seconds_sum{{{labels}}} {_metric_value(total)}")
+        lines.append(f"gpu_collector_stage_seconds_count{{{labels}}} {count}")
+    return lines
+
+
+class ResponseCache:
+    """ 预先序列化的响应，只有在有新快照到达后的首次请求时才重新生成 """
+
+    RENDERERS = {
+        "/api/state": (render_json, "application/json; charset=utf-8"),
+        "/metrics": (render_prometheus, "text/plain; version=0.0.4; charset=utf-8"),
+    }
+
+    def __init__(self, collector):
+        self.collector = collector
+        self._lock = threading.Lock()
+        self._dirty = set(self.RENDERERS)
+        self._cache = {}  # path -> (body, etag, content type)
+        collector.add_listener(self._on_snapshot)
+
+    def _on_snapshot(self, snapshot):
+        self._dirty = set(self.RENDERERS)
+
+    def get(self, path: str) -> tuple[bytes, str, str] | None:
+        if path not in self.RENDERERS:
+            return None
+        with self._lock:
+            if path in self._dirty or path not in self._cache:
+                self._dirty.discard(path)  # cleared before rendering so a sample arriving meanwhile re-marks it
+                render, content_type = self.RENDERERS[path]
+                body = render(self.collector.snapshots())
+                etag = '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+                self._cache[path] = (body, etag, content_type)
+            return self._cache[path]
+
+
+def start_http_api(collector, host: str, port: int) -> ThreadingHTTPServer:
+    from state_stream import StateStream
+    cache = ResponseCache(collector)
+    stream = StateStream(collector, max_queue=config.stream_queue_size, snapshot_interval=config.stream_snapshot_interval)
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] == "/api/stream":
+                self.send_stream()
+                return
+            entry = cache.get(self.path.split("?", 1)[0])
+            if entry is None:
+                self.send_error(404)
+                return
+            body, etag, content_type = entry
+            if etag in self.headers.get("If-None-Match", ""):
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("ETag", etag)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def send_stream(self):
+            """ server-sent events: a "snapshot" event with the full state, then a "delta" event per changed server """
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+            subscriber = stream.subscribe()
+            try:
+                while True:
+                    event = subscriber.next(stream, config.stream_keepalive)
+                    self.wfile.write(event if event is not None else b": keepalive\n\n")
+                    self.wfile.flush()
+            except OSError:  # the client went away
+                pass
+            finally:
+                stream.unsubscribe(subscriber)
+
+        def log_message(self, format, *args):
+            logger.debug(f"HTTP API: {format % args}")
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="gpu-http-api", daemon=True).start()
+    logger.info(f"HTTP API listening on {host}:{port}")
+    return server
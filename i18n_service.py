@@ -11,22 +11,30 @@ class I18nService:
         self._lang = "zh_CN"
         # 资源文件路径
         self._res_file = Path(__file__).parent / "res" / "i18n.json"
-        
+        # 资源文件在第一次取文本时才加载
+        self._translations = None
+
+    @property
+    def _lang_dict(self) -> dict:
+        if self._translations is None:
+            self._translations = self._load()
+        return self._translations
+
+    def _load(self) -> dict:
         # 如果资源文件不存在，则创建一个空的 JSON 文件
         if not self._res_file.exists():
             self._res_file.parent.mkdir(parents=True, exist_ok=True)
             self._res_file.touch()
             with open(self._res_file, "w", encoding="utf-8") as f:
                 json.dump({"Version": "1.0.0", "Languages": {}}, f, ensure_ascii=False, indent=4)
-        
+
         # 加载资源文件
-        self._lang_dict = {}
         with open(self._res_file, "r", encoding="utf-8") as f:
-            self._lang_dict = json.load(f).get("Languages", {})
+            return json.load(f).get("Languages", {})
 
     def set_lang(self, lang: str) -> None:
-        """ 设置当前语言 """
-        if lang in self._lang_dict:
+        """ 设置当前语言，资源文件尚未加载时不检查，不支持的语言在取文本时回退到中文 / 键本身 """
+        if self._translations is None or lang in self._translations:
             self._lang = lang
         else:
             raise ValueError(f"Unsupported language: {lang}")
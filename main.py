@@ -1,73 +1,196 @@
-import json
-from pathlib import Path
+import time
 import streamlit as st
+import pandas as pd
 
 import config
 from exec_hook import set_exechook
-from ding_notify import ding_print_txt
-from gpu_watcher import SingleGPUServerWatcher, SSH_STATUS_LUT
+from ding_notify import ding_print_txt, ding_status
+from gpu_watcher import SSH_STATUS_LUT
+from collector import GPUCollector
 from i18n_service import i18n
+from ssh_pool import ssh_pool
+from metrics import metrics
+from notify_dispatcher import notifier
+from adaptive_schedule import adaptive_scheduler
 
 # set_exechook()
 
-def get_server_watcher(info_file=Path(__file__).parent / "server_info.json"):
-    watchers = {}
-    with open(info_file, "r") as f:
-        server_info = json.load(f)
-    for server in server_info:  # server is already a dictionary
-        watcher = SingleGPUServerWatcher(
-            name=server["name"],
-            ip=server["ip"],
-            username=server["username"],
-            password=server.get("password", ""),
-            port=server.get("port", 22),  # default port is 22 if not specified
-            update_step=server.get("update_step", 10)  # default update step is 10 if not specified
-        )
-        watchers[server["name"]] = watcher
-    return watchers
+@st.cache_resource
+def get_collector():
+    """ one collector per process, shared by every browser session and rerun """
+    collector = GPUCollector()
+    collector.start(loop=True)  # every server polls at its own update_step, however many sessions are open
+    if config.http_api_port is not None:
+        collector.start_http_api(config.http_api_host, config.http_api_port)
+    if config.agent_receiver_port is not None:
+        collector.start_agent_receiver(config.agent_receiver_host, config.agent_receiver_port)
+    return collector
 
+def gpu_state_to_dataframe(sample):
+    """ format a gpu_parser.GPUSample for display """
+    return pd.DataFrame({
+        "gpu_name": sample.gpu_name,
+        "utilization.gpu": [f"{util:.0f} %" for util in sample.utilization_gpu],
+        "memory": [f"{used:.0f} MiB / {total:.0f} MiB" for used, total in zip(sample.memory_used, sample.memory_total)],
+        "timestamp": sample.timestamp,
+    })
+
+def processes_to_dataframe(processes):
+    """ format a gpu_parser.GPUProcesses for display """
+    if processes is None or len(processes) == 0:
+        return None
+    return pd.DataFrame({
+        "gpu": processes.gpu_index,
+        "pid": processes.pid,
+        "user": processes.user,
+        "memory": [f"{used:.0f} MiB" for used in processes.used_memory],
+    })
+
+def format_host_state(host_state):
+    if not host_state:
+        return None
+    parts = []
+    if "loadavg" in host_state:
+        parts.append(i18n.get_text("host_load").format(*host_state["loadavg"], host_state.get("cpus", "?")))
+    if "memory_total" in host_state:
+        parts.append(i18n.get_text("host_memory").format(host_state["memory_used"] / 1024, host_state["memory_total"] / 1024))
+    return " | ".join(parts)
+
+@st.cache_resource
+def get_view_cache():
+    """ formatted display data per server, shared by every session and rebuilt only when a new snapshot is published """
+    return {}
+
+def history_frames(watcher):
+    times, values = watcher.history.query(since=time.time() - config.history_plot_window)
+    if len(times) == 0:
+        return None
+    index = pd.to_datetime(times, unit="s")
+    columns = [f"GPU {i}" for i in range(watcher.history.gpu_count)]
+    return {field: pd.DataFrame(values[field], index=index, columns=columns) for field in ("utilization_gpu", "memory_percent")}
+
+def get_server_view(snapshot):
+    view_cache = get_view_cache()
+    view = view_cache.get(snapshot.name)
+    if view is not None and view["seq"] == snapshot.seq:
+        return view
+
+    view = {"seq": snapshot.seq}
+    if snapshot.ssh_state == SSH_STATUS_LUT["success"]:
+        summerized_gpu_state = snapshot.summerized_gpu_state
+        view.update({
+            "gpu_name": str(summerized_gpu_state["gpu_name"]),
+            "avg_gpu_util": f"{summerized_gpu_state['avg_gpu_util']:.2f}%",
+            "avg_mem_util": f"{summerized_gpu_state['avg_memory_util']:.2f}%",
+            "all_free": "✅Yes" if summerized_gpu_state["all_free"] else "❌No",
+            "have_free": "✅Yes" if summerized_gpu_state["have_free"] else "❌No",
+        })
+    view_cache[snapshot.name] = view
+    return view
+
+def display_history(frames):
+    if frames is None:
+        return
+    st.caption(i18n.get_text("history_gpu_util"))
+    st.line_chart(frames["utilization_gpu"], height=200)
+    st.caption(i18n.get_text("history_mem_util"))
+    st.line_chart(frames["memory_percent"], height=200)
+
+def rerun_if_servers_changed():
+    """ a reload of server_info.json added or removed servers since the page was built, rebuild the whole page """
+    if list(get_collector().watchers) != st.session_state.get("servers"):
+        st.rerun(scope="app")
+
+@st.fragment(run_every=config.page_update_freq) # every server refreshes on its own
 def display_single_server_page(name):
-    watcher = st.session_state["watchers"][name]
+    rerun_if_servers_changed()
+    watcher = get_collector().watchers.get(name)
+    if watcher is None:  # removed right after the check
+        st.rerun(scope="app")
+    snapshot = watcher.snapshot  # read one consistent state, the collector may publish a new one meanwhile
+    # while polling (also stale or restored from the checkpoint) keep showing the last sample
+    shown = snapshot if snapshot.gpu_state is not None else watcher.last_good
     st.write(f"### {watcher.name}")
-    message = watcher.message
-    ssh_state = watcher.ssh_state
+    message = snapshot.message
+    ssh_state = snapshot.ssh_state
+    if snapshot.restored_at is not None:
+        st.warning(i18n.get_text("restored_data").format(time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(snapshot.restored_at))))
+    elif snapshot.stale:
+        st.warning(i18n.get_text("stale_data"))
     if ssh_state == SSH_STATUS_LUT["error"]:
         st.error(message)
     elif ssh_state == SSH_STATUS_LUT["loading"]:
         st.info(message)
-    elif ssh_state == SSH_STATUS_LUT["success"]:
-        summerized_gpu_state = watcher.summerized_gpu_state
-        st.metric("GPU", str(summerized_gpu_state["gpu_name"]), border=True)
+    if ssh_state != SSH_STATUS_LUT["error"] and shown is not None:
+        view = get_server_view(shown)
+        st.metric("GPU", view["gpu_name"], border=True)
         col1, col2, col3, col4 = st.columns(4)
-        avg_gpu_util = summerized_gpu_state["avg_gpu_util"]
-        avg_mem_util = summerized_gpu_state["avg_memory_util"]
-        col1.metric(i18n.get_text("avg_gpu_util"), f"{avg_gpu_util:.2f}%", border=True)
-        col2.metric(i18n.get_text("avg_mem_util"), f"{avg_mem_util:.2f}%", border=True)
-        is_all_free = summerized_gpu_state["all_free"]
-        is_have_free = summerized_gpu_state["have_free"]
-        col3.metric(i18n.get_text("all_gpu_free"), "✅Yes" if is_all_free else "❌No", border=True)
-        col4.metric(i18n.get_text("have_gpu_free"), "✅Yes" if is_have_free else "❌No", border=True)
-
-        with st.expander(i18n.get_text("see_details")):
-            state = watcher.gpu_state
-            new_order = ["gpu_name", 'utilization.gpu', 'memory', 'timestamp']
-            st.write(state[new_order])
+        col1.metric(i18n.get_text("avg_gpu_util"), view["avg_gpu_util"], border=True)
+        col2.metric(i18n.get_text("avg_mem_util"), view["avg_mem_util"], border=True)
+        col3.metric(i18n.get_text("all_gpu_free"), view["all_free"], border=True)
+        col4.metric(i18n.get_text("have_gpu_free"), view["have_free"], border=True)
+        if shown.poll_latency is not None:
+            pool_stats = ssh_pool.get_stats()
+            st.caption(i18n.get_text("poll_stats").format(shown.poll_latency, pool_stats["handshakes"], pool_stats["reuses"]))
 
     st.write(f"##### {i18n.get_text('button_part')}")
 
     col1, col2 = st.columns(2)
     with col1:
         if st.button(i18n.get_text("update_once"), key=name, icon="🔂"):
-            st.session_state["watchers"][name].restart_run(loop=st.session_state["watchers"][name].is_looping)
+            watcher.restart_run(loop=watcher.is_looping)
     with col2:
-        if st.button(i18n.get_text("loop_watch_setting")):
+        if st.button(i18n.get_text("loop_watch_setting"), key=f"loop_setting_{name}"):
             loop_setting_page(name)
 
 
+@st.fragment # the toggles alone, the tables and charts are only built and sent when asked for
+def display_server_details(name):
+    watcher = get_collector().watchers.get(name)
+    if watcher is None:  # removed from server_info.json, the periodic panel reruns the page
+        return
+    col1, col2 = st.columns(2)
+    show_details = col1.toggle(i18n.get_text("see_details"), key=f"details_{name}")
+    show_history = col2.toggle(i18n.get_text("see_history"), key=f"history_{name}")
+    if show_details or show_history:
+        display_live_details(name, show_details, show_history)
+
+
+@st.fragment(run_every=config.page_update_freq) # only exists while a toggle is on
+def display_live_details(name, show_details, show_history):
+    watcher = get_collector().watchers.get(name)
+    snapshot = watcher.last_good if watcher is not None else None
+    if snapshot is None:
+        return
+    # rebuilt only when a new good sample arrives, shared by every session like the panels
+    view_cache = get_view_cache()
+    key = f"{name}/details"
+    view = view_cache.get(key)
+    if view is None or view["seq"] != snapshot.seq:
+        view = {"seq": snapshot.seq}
+        view_cache[key] = view
+    if show_details:
+        if "gpus" not in view:
+            view["gpus"] = gpu_state_to_dataframe(snapshot.gpu_state)
+            view["processes"] = processes_to_dataframe(snapshot.process_state)
+            view["host"] = format_host_state(snapshot.host_state)
+        st.write(view["gpus"])
+        if view["processes"] is not None:
+            st.write(view["processes"])
+        if view["host"] is not None:
+            st.caption(view["host"])
+    if show_history:
+        if "history" not in view:
+            view["history"] = history_frames(watcher)
+        display_history(view["history"])
+
+
 @st.dialog(i18n.get_text("loop_watch_setting"))
 def loop_setting_page(server_name):
     st.write("### " + server_name)
-    watcher = st.session_state["watchers"][server_name]
+    watcher = get_collector().watchers.get(server_name)
+    if watcher is None:
+        return
     # get current settings
     current_settings = {
         "update_step": watcher.update_step,
@@ -94,25 +217,23 @@ def loop_setting_page(server_name):
                         default=current_settings["need_dingding_remind"],
                         disabled = not need_loop_watch)
     
-    if not st.session_state["dingAvailable"]:
+    if not ding_status["available"]:
         st.caption(i18n.get_text("validate_dingding_hint"))
     else:
         st.caption("")
 
     if st.button(i18n.get_text("validate_ding"), 
-                 disabled = need_dingding_remind == i18n.get_text("no_dingding_remind") or st.session_state["dingAvailable"],
+                 disabled = need_dingding_remind == i18n.get_text("no_dingding_remind") or ding_status["available"],
                  help=i18n.get_text("validate_dingding_help")):
         result = ding_print_txt(i18n.get_text("dingdingTest_success"))
         if result is not None:
             st.error(i18n.get_text("dingdingTest_fail").format(result))
-            st.session_state["dingAvailable"] = False
         else:
             st.success(i18n.get_text("dingdingTest_success"))
-            st.session_state["dingAvailable"] = True
     
     dingding_remind_mode = st.radio("", 
             [i18n.get_text("dingding_remind_once"), i18n.get_text("dingding_remind_every")], index=0,  
-            disabled = need_dingding_remind == i18n.get_text("no_dingding_remind") or not st.session_state["dingAvailable"])
+            disabled = need_dingding_remind == i18n.get_text("no_dingding_remind") or not ding_status["available"])
 
     st.divider()
 
@@ -130,25 +251,106 @@ def loop_setting_page(server_name):
 
     
         
-@st.fragment(run_every=config.page_update_freq) # keep updating gpu page
-def display_server_state_page():
-    for name in st.session_state["watchers"].keys():
-        st.divider()
-        display_single_server_page(name)
+def build_overview(snapshots):
+    rows = []
+    for name, snapshot in snapshots.items():
+        summerized_gpu_state = snapshot.summerized_gpu_state if snapshot.ssh_state != SSH_STATUS_LUT["error"] else None
+        rows.append({
+            "server": name,
+            "state": {0: "✅", 1: "⏳", -1: "❌"}[snapshot.ssh_state],
+            "gpu_name": summerized_gpu_state["gpu_name"] if summerized_gpu_state else "",
+            "avg_gpu_util": summerized_gpu_state["avg_gpu_util"] if summerized_gpu_state else None,
+            "avg_memory_util": summerized_gpu_state["avg_memory_util"] if summerized_gpu_state else None,
+            "all_free": summerized_gpu_state["all_free"] if summerized_gpu_state else None,
+            "have_free": summerized_gpu_state["have_free"] if summerized_gpu_state else None,
+            "updated_at": pd.to_datetime(snapshot.updated_at, unit="s"),
+        })
+    return pd.DataFrame(rows)
+
+@st.fragment(run_every=config.page_update_freq)
+def display_overview_grid():
+    """ one compact table for the whole fleet, rebuilt only when any server has a new snapshot """
+    rerun_if_servers_changed()
+    snapshots = get_collector().snapshots()
+    version = tuple(snapshot.seq for snapshot in snapshots.values())
+    view_cache = get_view_cache()
+    cached = view_cache.get("__overview__")
+    if cached is None or cached[0] != version:
+        cached = (version, build_overview(snapshots), get_collector().fleet_summary())
+        view_cache["__overview__"] = cached
+    fleet = cached[2]
+    columns = st.columns(4)
+    columns[0].metric(i18n.get_text("fleet_gpus"), fleet.gpus)
+    columns[1].metric(i18n.get_text("fleet_free_gpus"), fleet.free_gpus)
+    columns[2].metric(i18n.get_text("avg_gpu_util"), f"{fleet.fleet_gpu_util:.1f}%")
+    columns[3].metric(i18n.get_text("fleet_servers_all_free"), int(fleet.all_free.sum()))
+    st.dataframe(cached[1], hide_index=True, use_container_width=True, column_config={
+        "avg_gpu_util": st.column_config.ProgressColumn(i18n.get_text("avg_gpu_util"), format="%.1f%%", min_value=0, max_value=100),
+        "avg_memory_util": st.column_config.ProgressColumn(i18n.get_text("avg_mem_util"), format="%.1f%%", min_value=0, max_value=100),
+        "all_free": st.column_config.CheckboxColumn(i18n.get_text("all_gpu_free")),
+        "have_free": st.column_config.CheckboxColumn(i18n.get_text("have_gpu_free")),
+    })
+
+@st.fragment(run_every=config.page_update_freq)
+def display_gpu_finder():
+    """ "N free GPUs with at least M GiB on one server", answered by the collector's FreeGPUIndex """
+    collector = get_collector()
+    st.write(f"##### {i18n.get_text('gpu_finder')}")
+    count = st.number_input(i18n.get_text("gpu_finder_count"), min_value=1, max_value=16, value=1, key="finder_count")
+    memory_gib = st.number_input(i18n.get_text("gpu_finder_memory"), min_value=0.0, value=0.0, step=8.0, key="finder_memory")
+    model = st.selectbox(i18n.get_text("gpu_finder_model"), [None, *collector.gpu_index.models()], key="finder_model",
+                         format_func=lambda model: i18n.get_text("gpu_finder_any_model") if model is None else model)
+    placements = collector.find_free_gpus(count, memory_gib * 1024, model, limit=20)
+    if placements:
+        st.dataframe(pd.DataFrame([{
+            "server": placement.server,
+            "gpus": ", ".join(map(str, placement.gpus)),
+            "min_free_gib": round(min(placement.free_memory) / 1024, 1),
+        } for placement in placements]), hide_index=True, use_container_width=True)
+    else:
+        st.info(i18n.get_text("gpu_finder_none"))
+    st.caption(i18n.get_text("gpu_finder_total").format(collector.gpu_index.free_count()))
+
+@st.fragment(run_every=config.page_update_freq)
+def display_debug_metrics():
+    """ where the time of a poll goes, slowest stage / server first """
+    st.write(f"##### {i18n.get_text('debug_metrics')}")
+    if not metrics.enabled:
+        st.info(i18n.get_text("debug_metrics_disabled"))
+    else:
+        st.dataframe(pd.DataFrame(metrics.summary()), hide_index=True, use_container_width=True)
+    st.json({"ssh_pool": ssh_pool.get_stats(), "notifications": notifier.stats, "adaptive_schedule": adaptive_scheduler.get_stats()},
+            expanded=False)
 
 def main():
     st.title(i18n.get_text("page_title"))
-    st.session_state["watchers"] = get_server_watcher()
-    st.session_state["dingAvailable"] = False
-    
-    for watcher in st.session_state["watchers"].values():
-        watcher.start_run(loop=False)
+    # watchers are owned by the shared collector, sessions only read their snapshots
+    # the collector changes its dict in place when server_info.json is reloaded, the fragments look servers up by name
+    watchers = get_collector().watchers
+    st.session_state["servers"] = list(watchers)
 
     if st.button(i18n.get_text("update_all"), type="primary", icon="🔁"):
-        for watcher in st.session_state["watchers"].values():
-            watcher.restart_run(loop=watcher.is_looping)
+        result = get_collector().refresh_all(deadline=config.fleet_refresh_deadline)
+        st.toast(i18n.get_text("refresh_all_result").format(len(result.latency), len(result.stale), result.elapsed))
 
-    display_server_state_page()
+    with st.sidebar:
+        display_gpu_finder()
+    if st.sidebar.toggle(i18n.get_text("debug_metrics")):
+        display_debug_metrics()
+        st.divider()
+
+    if st.toggle(i18n.get_text("overview_mode"), value=len(watchers) > config.overview_grid_threshold):
+        display_overview_grid()
+        name = st.selectbox(i18n.get_text("select_server"), st.session_state["servers"])
+        if name is not None:
+            st.divider()
+            display_single_server_page(name)
+            display_server_details(name)
+    else:
+        for name in st.session_state["servers"]:
+            st.divider()
+            display_single_server_page(name)
+            display_server_details(name)
 
 if __name__ == '__main__':
     st.set_page_config(
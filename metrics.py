@@ -0,0 +1,125 @@
+""" self-metrics of the collector: latency histograms of every stage of a poll, per server """
+
+import math
+import time
+import bisect
+import threading
+
+import config
+
+# upper bounds (seconds) of the histogram buckets, the last bucket is +Inf
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class Histogram:
+    """ 固定桶的耗时直方图 """
+
+    __slots__ = ("counts", "count", "sum", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q: float) -> float:
+        """ 按桶上界估计的分位数 """
+        if self.count == 0:
+            return math.nan
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return min(BUCKETS[i], self.max) if i < len(BUCKETS) else self.max
+        return self.max
+
+
+class _Timer:
+    __slots__ = ("registry", "stage", "server", "start")
+
+    def __init__(self, registry, stage, server):
+        self.registry = registry
+        self.stage = stage
+        self.server = server
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.registry.observe(self.stage, time.perf_counter() - self.start, self.server)
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class Metrics:
+    """
+    阶段耗时统计
+    - with metrics.timer("parse", server): ... 记录一次耗时
+    - 关闭时 timer() 返回共享的空计时器，几乎没有开销
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._histograms = {}  # (stage, server) -> Histogram
+
+    def timer(self, stage: str, server: str = ""):
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, stage, server)
+
+    def observe(self, stage: str, seconds: float, server: str = ""):
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self._histograms.get((stage, server))
+            if histogram is None:
+                histogram = self._histograms[(stage, server)] = Histogram()
+            histogram.observe(seconds)
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+    def summary(self) -> list[dict]:
+        """ one row per (stage, server), slowest p99 first """
+        with self._lock:
+            rows = [{
+                "stage": stage,
+                "server": server,
+                "count": h.count,
+                "mean_ms": h.sum / h.count * 1e3,
+                "p50_ms": h.quantile(0.5) * 1e3,
+                "p99_ms": h.quantile(0.99) * 1e3,
+                "max_ms": h.max * 1e3,
+            } for (stage, server), h in self._histograms.items() if h.count]
+        return sorted(rows, key=lambda row: row["p99_ms"], reverse=True)
+
+    def histograms(self) -> dict[tuple[str, str], tuple[list[int], float, int]]:
+        """ copy of every histogram: (stage, server) -> (bucket counts, sum, count) """
+        with self._lock:
+            return {key: (list(h.counts), h.sum, h.count) for key, h in self._histograms.items()}
+
+
+metrics = Metrics(enabled=config.self_metrics)
@@ -0,0 +1,136 @@
+""" asynchronous notification queue: coalesces, deduplicates and rate limits reminders off the poll path """
+
+import time
+import queue
+import threading
+
+import config
+from interfaces import IBotAnnouncer
+from ding_notify import ding_print_txt
+from logger import logger
+from metrics import metrics
+from i18n_service import i18n
+
+
+class DingDingAnnouncer(IBotAnnouncer):
+    """ 钉钉机器人播报 """
+
+    def send(self, message: str) -> None:
+        with metrics.timer("notify_send"):
+            error = ding_print_txt(message)
+        if error is not None:
+            raise RuntimeError(f"DingDing send failed: {error}")
+
+
+class TokenBucket:
+    """ 令牌桶限流 """
+
+    def __init__(self, rate_per_minute: float):
+        self.capacity = rate_per_minute
+        self.tokens = rate_per_minute
+        self.fill_rate = rate_per_minute / 60  # tokens per second
+        self.last = time.monotonic()
+
+    def wait_time(self) -> float:
+        """ 取一个令牌需要等待的秒数，为 0 时已经取走 """
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.fill_rate)
+        self.last = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.fill_rate
+
+
+class NotificationDispatcher:
+    """
+    通知分发器
+    - notify() 只入队，不阻塞调用方
+    - 后台线程把 window 秒内的事件合并成一条摘要消息
+    - 同一 key 在 dedup_ttl 秒内只发送一次
+    - 发送受令牌桶限速，失败后指数退避重试
+    """
+
+    def __init__(self, announcer: IBotAnnouncer, window: float = 10, rate_per_minute: float = 20,
+                 dedup_ttl: float = 60, max_retries: int = 3):
+        self.announcer = announcer
+        self.window = window
+        self.bucket = TokenBucket(rate_per_minute)
+        self.dedup_ttl = dedup_ttl
+        self.max_retries = max_retries
+
+        self._queue = queue.Queue()
+        self._recent = {}  # key -> time it was last sent
+        self._thread = None
+        self._lock = threading.Lock()
+        self.stats = {"queued": 0, "sent": 0, "deduplicated": 0, "failed": 0}
+
+    def notify(self, key: str, message: str):
+        """ key 相同的事件视为重复，例如 "reminder:have_free:<server>" """
+        self.stats["queued"] += 1
+        self._queue.put((key, message))
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="gpu-notify", daemon=True)
+                self._thread.start()
+
+    def _collect(self) -> list[tuple[str, str]]:
+        """ 阻塞直到有事件，然后继续收集 window 秒内到达的事件 """
+        events = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while (remaining := deadline - time.monotonic()) > 0:
+            try:
+                events.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return events
+
+    def _deduplicate(self, events: list[tuple[str, str]]) -> list[str]:
+        now = time.monotonic()
+        self._recent = {key: sent for key, sent in self._recent.items() if now - sent < self.dedup_ttl}
+        messages = []
+        for key, message in events:
+            if key in self._recent:
+                self.stats["deduplicated"] += 1
+                continue
+            self._recent[key] = now
+            messages.append(message)
+        return messages
+
+    def _send(self, content: str):
+        for attempt in range(self.max_retries + 1):
+            while (wait := self.bucket.wait_time()) > 0:
+                time.sleep(wait)
+            try:
+                self.announcer.send(content)
+                self.stats["sent"] += 1
+                return
+            except Exception as e:
+                if attempt == self.max_retries:
+                    logger.warning(f"Notification attempt {attempt + 1} failed: {e}")
+                    break
+                delay = min(60, 2 ** attempt)
+                logger.warning(f"Notification attempt {attempt + 1} failed, retry in {delay}s: {e}")
+                time.sleep(delay)
+        self.stats["failed"] += 1
+        logger.error(f"Dropped notification after {self.max_retries + 1} attempts: {content}")
+
+    def _run(self):
+        while True:
+            messages = self._deduplicate(self._collect())
+            if not messages:
+                continue
+            if len(messages) == 1:
+                content = messages[0]
+            else:
+                content = i18n.get_text("notify_digest_title").format(len(messages)) + "\n" + "\n".join(messages)
+            self._send(content)
+
+
+notifier = NotificationDispatcher(
+    DingDingAnnouncer(),
+    window=config.notify_coalesce_window,
+    rate_per_minute=config.notify_rate_per_minute,
+    dedup_ttl=config.notify_dedup_ttl,
+    max_retries=config.notify_max_retries,
+)
@@ -0,0 +1,176 @@
+""" asyncio polling engine, drives every watcher from one event loop """
+
+import time
+import random
+import asyncio
+import threading
+import concurrent.futures
+
+import config
+from logger import logger
+from gpu_stream import GPUStreamParser
+
+
+class PollTask:
+    """ 调度到引擎上的一个任务：可以唤醒正在等待的轮询，也可以在限定时间内取消 """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self._loop = loop
+        self.future = None  # concurrent future of the coroutine
+        self.finished = threading.Event()  # set once the coroutine has really exited
+        self.wake_event = None  # asyncio.Event, created on the engine loop
+
+    def done(self) -> bool:
+        return self.finished.is_set()
+
+    def wake(self):
+        """ 结束当前的等待，立即开始下一次查询 """
+        if self.wake_event is not None:
+            self._loop.call_soon_threadsafe(self.wake_event.set)
+
+    def cancel(self, timeout: float) -> bool:
+        """ 取消任务并等待其退出，返回是否在 timeout 秒内退出 """
+        self.future.cancel()
+        return self.finished.wait(timeout)
+
+
+class PollEngine:
+    """ 单事件循环调度所有服务器的轮询，阻塞的 SSH 调用放在有界线程池中执行 """
+
+    def __init__(self, max_concurrency: int = 32, host_timeout: float = 60, jitter: float = 0.1):
+        self.max_concurrency = max_concurrency  # at most this many hosts are queried at the same time
+        self.host_timeout = host_timeout  # seconds one query may take before it is abandoned
+        self.jitter = jitter  # relative random spread applied to every update_step
+
+        self._loop = None
+        self._thread = None
+        self._semaphore = None
+        self._lock = threading.Lock()
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="gpu-poll")
+
+    def _ensure_started(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._semaphore = asyncio.Semaphore(self.max_concurrency)
+                self._thread = threading.Thread(target=self._loop.run_forever, name="gpu-poll-engine", daemon=True)
+                self._thread.start()
+                logger.info(f"Started poll engine, max concurrency {self.max_concurrency}")
+            return self._loop
+
+    def schedule(self, watcher, loop: bool = False) -> PollTask:
+        """ 调度一个 watcher，返回任务句柄 """
+        task = PollTask(self._ensure_started())
+        task.future = asyncio.run_coroutine_threadsafe(self._run_task(task, watcher, loop), task._loop)
+        return task
+
+    def poll(self, watcher) -> concurrent.futures.Future:
+        """ 立即查询一次，不影响正在进行的循环监视，future 的结果为本次查询耗时（秒） """
+        return asyncio.run_coroutine_threadsafe(self._timed_poll(watcher), self._ensure_started())
+
+    def serve(self, handler, host: str, port: int, limit: int = 2 ** 20) -> asyncio.AbstractServer:
+        """ TCP server on the engine loop, the coroutine handler(reader, writer) runs for every connection """
+        start = asyncio.start_server(handler, host, port, limit=limit)
+        return asyncio.run_coroutine_threadsafe(start, self._ensure_started()).result()
+
+    async def run_blocking(self, func, *args):
+        """ from a coroutine on the engine loop, run a blocking watcher method in the poll threads """
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def _timed_poll(self, watcher) -> float:
+        start = time.perf_counter()
+        await self._poll_once(watcher)
+        return time.perf_counter() - start
+
+    def _jittered(self, seconds: float) -> float:
+        return seconds * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    async def _run_task(self, task: PollTask, watcher, loop: bool):
+        task.wake_event = asyncio.Event()
+        try:
+            await self._run(task, watcher, loop)
+        finally:
+            task.finished.set()
+
+    async def _run(self, task: PollTask, watcher, loop: bool):
+        if not loop:
+            await self._poll_once(watcher)
+            logger.info(f"Updated GPU info for {watcher.name}")
+            return
+        while True:
+            await self._poll_once(watcher)  # in stream mode also the processes / host load, the stream only has GPU rows
+            logger.info(f"Updated GPU info for {watcher.name}")
+            if watcher.stream:
+                await self._stream(watcher)
+            await self._wait(task, self._jittered(watcher.next_poll_interval()))
+
+    @staticmethod
+    async def _wait(task: PollTask, seconds: float):
+        """ sleep until the next poll, returns early when the task is woken up """
+        try:
+            await asyncio.wait_for(task.wake_event.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+        task.wake_event.clear()
+
+    async def _poll_once(self, watcher):
+        loop = asyncio.get_running_loop()
+        async with self._semaphore:
+            try:
+                await asyncio.wait_for(loop.run_in_executor(self._executor, watcher.get_gpu_info), self.host_timeout)
+            except asyncio.TimeoutError:
+                watcher.set_timeout_state(self.host_timeout)
+
+    async def _stream(self, watcher):
+        """
+        streaming mode, returns when the stream breaks so the caller can fall back to one-shot queries
+        every update_step seconds a one-shot query between two frames refreshes the processes / host load
+        """
+        loop = asyncio.get_running_loop()
+        channel = None
+        fd = None
+        frames = asyncio.Queue()
+        parser = GPUStreamParser()
+
+        def on_readable():
+            try:
+                while channel.recv_ready():
+                    for rows in parser.feed(channel.recv(65536)):
+                        frames.put_nowait(rows)
+                if channel.eof_received or channel.closed:
+                    raise EOFError(f"stream closed by remote (exit status {channel.exit_status})")
+            except Exception as e:
+                loop.remove_reader(fd)
+                frames.put_nowait(e)
+
+        try:
+            async with self._semaphore:
+                channel = await asyncio.wait_for(loop.run_in_executor(self._executor, watcher.open_stream), self.host_timeout)
+            fd = channel.fileno()  # paramiko signals readability through this pipe
+            loop.add_reader(fd, on_readable)
+            stall_timeout = max(10.0, 3 * watcher.stream_interval_ms / 1000)
+            polled_at = loop.time()
+            while True:
+                item = await asyncio.wait_for(frames.get(), stall_timeout)
+                if isinstance(item, Exception):
+                    raise item
+                await loop.run_in_executor(self._executor, watcher.update_stream_frame, item)
+                if loop.time() - polled_at >= watcher.update_step:
+                    await self._poll_once(watcher)  # frames arriving meanwhile wait in the queue
+                    polled_at = loop.time()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Stream of {watcher.name} broken, falling back to one-shot query: {e!r}")
+        finally:
+            if fd is not None:
+                loop.remove_reader(fd)
+            if channel is not None:
+                channel.close()
+
+
+poll_engine = PollEngine(
+    max_concurrency=config.poll_max_concurrency,
+    host_timeout=config.poll_host_timeout,
+    jitter=config.poll_jitter,
+)
@@ -0,0 +1,253 @@
+"""
+local stand-in for GPU servers: an SSH server answering the watcher's commands with synthetic nvidia-smi output
+
+    python simulator.py --port 2222 --gpus 8 --latency 0.05
+
+bound to 0.0.0.0 (the default), every loopback address (127.0.0.1, 127.0.0.2, ...) is a separate host with its own GPUs,
+any username / password is accepted unless --auth-error-rate is set, and it can be used as a jump host (direct-tcpip) to loopback destinations
+only clients on a loopback address are served, connections from other machines are closed before the handshake
+"""
+
+import time
+import random
+import select
+import socket
+import argparse
+import ipaddress
+import threading
+import zlib
+
+import paramiko
+
+from logger import logger
+
+
+def _is_loopback(host: str) -> bool:
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:  # any other host name
+        return False
+
+
+class SimulatedGPUs:
+    """ GPU state of one simulated host, jobs start and stop at random """
+
+    def __init__(self, host: str, gpu_count: int):
+        self.rng = random.Random(zlib.crc32(host.encode()))
+        self.host = host
+        self.gpu_count = gpu_count
+        self.busy = [self.rng.random() < 0.5 for _ in range(gpu_count)]
+        self.lock = threading.Lock()
+
+    def step(self):
+        with self.lock:
+            for i in range(self.gpu_count):
+                if self.rng.random() < 0.02:
+                    self.busy[i] = not self.busy[i]
+
+    def gpu_rows(self, with_index: bool = False) -> list[str]:
+        self.step()
+        timestamp = time.strftime("%Y/%m/%d %H:%M:%S.000")
+        rows = []
+        for i, busy in enumerate(self.busy):
+            util = self.rng.randint(70, 100) if busy else 0
+            used = 30000 if busy else 0
+            row = (f"NVIDIA A100-SXM4-40GB, {timestamp}, {40 + util // 4}, {util}, {util // 3}, "
+                   f"40960, {40960 - used}, {used}, GPU-{self.host}-{i}")
+            rows.append(f"{i}, {row}" if with_index else row)
+        return rows
+
+    def collect_output(self) -> str:
+        """ output of gpu_watcher.COMMAND """
+        lines = ["@@gpu", *self.gpu_rows(), "@@apps"]
+        lines += [f"GPU-{self.host}-{i}, {10000 + i}, 30000, user{i % 3}" for i, busy in enumerate(self.busy) if busy]
+        lines += ["@@host", f"{sum(self.busy):.2f} 1.00 1.00 1/100 12345", "64", "Mem: 257000 64000 193000 0 0 190000"]
+        return "\n".join(lines) + "\n"
+
+
+class SimulatedHost(paramiko.ServerInterface):
+    """ one SSH connection to the simulator """
+
+    def __init__(self, simulator: "Simulator", host: str):
+        self.simulator = simulator
+        self.host = host
+        self.tunnels = {}  # channel id -> destination of direct-tcpip channels (the simulator as a jump host)
+
+    def get_allowed_auths(self, username):
+        return "password,publickey"
+
+    def _auth(self):
+        if random.random() < self.simulator.auth_error_rate:
+            return paramiko.AUTH_FAILED
+        return paramiko.AUTH_SUCCESSFUL
+
+    def check_auth_password(self, username, password):
+        return self._auth()
+
+    def check_auth_publickey(self, username, key):
+        return self._auth()
+
+    def check_channel_request(self, kind, chanid):
+        if kind == "session":
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_direct_tcpip_request(self, chanid, origin, destination):
+        if not _is_loopback(destination[0]):
+            return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED  # only tunnels to the other simulated hosts
+        self.tunnels[chanid] = destination
+        return paramiko.OPEN_SUCCEEDED
+
+    def check_channel_exec_request(self, channel, command):
+        command = command.decode() if isinstance(command, bytes) else command
+        # answered from another thread once the exec request has been acknowledged
+        delay = max(0.01, self.simulator.latency + random.uniform(0, self.simulator.latency_jitter))
+        threading.Timer(delay, self.simulator.answer, args=(channel, self.host, command)).start()
+        return True
+
+
+class Simulator:
+    """ SSH server of the simulated hosts, runs in background threads """
+
+    def __init__(self, host: str = "0.0.0.0", port: int = 2222, gpu_count: int = 8, latency: float = 0.0,
+                 latency_jitter: float = 0.0, failure_rate: float = 0.0, auth_error_rate: float = 0.0):
+        self.host = host
+        self.port = port
+        self.gpu_count = gpu_count
+        self.latency = latency  # seconds before a command answers
+        self.latency_jitter = latency_jitter  # extra random delay, uniform in [0, latency_jitter]
+        self.failure_rate = failure_rate  # probability that a command fails without output
+        self.auth_error_rate = auth_error_rate  # probability that an authentication is rejected
+
+        self.host_key = paramiko.RSAKey.generate(2048)
+        self.gpus = {}  # host address -> SimulatedGPUs
+        self._lock = threading.Lock()
+        self._sock = None
+        self.stats = {"connections": 0, "commands": 0, "failures": 0, "tunnels": 0}
+
+    def _gpus(self, host: str) -> SimulatedGPUs:
+        with self._lock:
+            if host not in self.gpus:
+                self.gpus[host] = SimulatedGPUs(host, self.gpu_count)
+            return self.gpus[host]
+
+    def answer(self, channel: paramiko.Channel, host: str, command: str):
+        self.stats["commands"] += 1
+        try:
+            if random.random() < self.failure_rate:
+                self.stats["failures"] += 1
+                channel.sendall_stderr(b"NVIDIA-SMI has failed because it couldn't communicate with the NVIDIA driver\n")
+                channel.send_exit_status(9)
+            elif "--loop-ms=" in command:
+                self._stream(channel, host, int(command.split("--loop-ms=")[1].split()[0]))
+            else:
+                channel.sendall(self._gpus(host).collect_output().encode())
+                channel.send_exit_status(0)
+        except (OSError, EOFError, paramiko.SSHException):
+            pass  # the client went away
+        finally:
+            channel.close()
+
+    def _stream(self, channel: paramiko.Channel, host: str, interval_ms: int):
+        gpus = self._gpus(host)
+        while not channel.closed:
+            channel.sendall(("\n".join(gpus.gpu_rows(with_index=True)) + "\n").encode())
+            time.sleep(interval_ms / 1000)
+
+    def _forward(self, channel: paramiko.Channel, destination: tuple):
+        """ pipe a direct-tcpip channel to its destination """
+        self.stats["tunnels"] += 1
+        try:
+            with socket.create_connection(destination, timeout=10) as sock:
+                while True:
+                    readable, _, _ = select.select([sock, channel], [], [])
+                    if sock in readable:
+                        data = sock.recv(65536)
+                        if not data:
+                            break
+                        channel.sendall(data)
+                    if channel in readable:
+                        data = channel.recv(65536)
+                        if not data:
+                            break
+                        sock.sendall(data)
+        except (OSError, EOFError, paramiko.SSHException):
+            pass
+        finally:
+            channel.close()
+
+    def _serve(self, client: socket.socket, address: tuple):
+        self.stats["connections"] += 1
+        transport = paramiko.Transport(client)
+        transport.add_server_key(self.host_key)
+        server = SimulatedHost(self, client.getsockname()[0])
+        try:
+            transport.start_server(server=server)
+        except (paramiko.SSHException, EOFError, OSError) as e:
+            logger.debug(f"Simulator handshake with {address} failed: {e}")
+            return
+        channels = []  # paramiko closes channels that are garbage collected, keep them until they are done
+        while transport.is_active():
+            channel = transport.accept(1)  # sessions are answered from check_channel_exec_request
+            channels = [c for c in channels if not c.closed]
+            if channel is None:
+                continue
+            channels.append(channel)
+            destination = server.tunnels.pop(channel.get_id(), None)
+            if destination is not None:
+                threading.Thread(target=self._forward, args=(channel, destination), daemon=True).start()
+
+    def _accept_loop(self):
+        while True:
+            try:
+                client, address = self._sock.accept()
+            except OSError:
+                return  # stopped
+            if not _is_loopback(address[0]):
+                logger.warning(f"Simulator refused {address[0]}, only local clients are served")
+                client.close()
+                continue
+            threading.Thread(target=self._serve, args=(client, address), daemon=True).start()
+
+    def start(self) -> "Simulator":
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind((self.host, self.port))
+        self._sock.listen(1024)
+        self.port = self._sock.getsockname()[1]  # when started on port 0
+        threading.Thread(target=self._accept_loop, name="gpu-simulator", daemon=True).start()
+        logger.info(f"Simulator listening on {self.host}:{self.port}, {self.gpu_count} GPUs per host")
+        return self
+
+    def stop(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+
+def simulated_server_info(count: int, port: int, **fields) -> list[dict]:
+    """ server_info.json entries of `count` simulated hosts at 127.0.x.y """
+    return [{"name": f"sim-{i:04d}", "ip": f"127.0.{(i + 1) // 250}.{(i + 1) % 250 + 1}", "port": port,
+             "username": "sim", "password": "sim", **fields} for i in range(count)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bind", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=2222)
+    parser.add_argument("--gpus", type=int, default=8, help="GPUs per host")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds before a command answers")
+    parser.add_argument("--latency-jitter", type=float, default=0.0, help="extra random delay in seconds")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="probability that a command fails")
+    parser.add_argument("--auth-error-rate", type=float, default=0.0, help="probability that a login is rejected")
+    args = parser.parse_args()
+
+    simulator = Simulator(args.bind, args.port, gpu_count=args.gpus, latency=args.latency, latency_jitter=args.latency_jitter,
+                          failure_rate=args.failure_rate, auth_error_rate=args.auth_error_rate).start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        simulator.stop()
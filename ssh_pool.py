@@ -0,0 +1,263 @@
+""" SSH connection pool, keep one authenticated transport per host """
+
+from __future__ import annotations
+
+import time
+import socket
+import threading
+from dataclasses import dataclass, field
+from typing import Callable, TYPE_CHECKING
+
+import config
+from logger import logger
+from metrics import metrics
+
+if TYPE_CHECKING:
+    import paramiko
+
+
+@dataclass(frozen=True)
+class SSHTarget:
+    """ 连接一台服务器所需的参数 """
+    ip: str
+    port: int = 22
+    username: str | None = None
+    password: str | None = None
+    connect_timeout: float | None = None  # TCP connect
+    auth_timeout: float | None = None  # waiting for the authentication response
+    banner_timeout: float | None = None  # waiting for the SSH banner
+    command_timeout: float | None = None  # no output for this long aborts a command
+    key_filename: str | None = None  # private key, tried before the password
+    gateway: SSHTarget | None = None  # jump host (ProxyJump), the connection is tunneled through it
+    name: str = field(default="", compare=False)  # server name, only used to label metrics
+
+    @property
+    def key(self) -> tuple:
+        return (self.ip, self.port, self.username, self.gateway.key if self.gateway is not None else None)
+
+
+class _PooledConnection:
+    """ 单个主机的长连接 """
+
+    def __init__(self, key: tuple):
+        self.key = key
+        self.client = None
+        self.lock = threading.Lock()  # one exec at a time per host
+        self.failures = 0  # consecutive connect failures, used for backoff
+        self.next_retry = 0.0  # monotonic time before which we do not reconnect
+
+
+class SSHConnectionPool:
+    """ SSH连接池：复用已认证的连接，keepalive 检测，断开后指数退避重连 """
+
+    def __init__(self, keepalive_interval: int = 30, backoff_base: float = 1.0, backoff_max: float = 300.0):
+        self.keepalive_interval = keepalive_interval
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self._conns = {}
+        self._lock = threading.Lock()
+        self.stats = {
+            "handshakes": 0,  # full TCP + kex + auth handshakes
+            "reuses": 0,  # exec_command served by an existing transport
+            "reconnects": 0,  # handshakes caused by a dead transport
+            "failures": 0,  # failed connect attempts
+            "tunnels": 0,  # connections opened through a gateway
+        }
+
+    def _get_conn(self, key: tuple) -> _PooledConnection:
+        with self._lock:
+            conn = self._conns.get(key)
+            if conn is None:
+                conn = _PooledConnection(key)
+                self._conns[key] = conn
+            return conn
+
+    @staticmethod
+    def _is_alive(conn: _PooledConnection) -> bool:
+        if conn.client is None:
+            return False
+        transport = conn.client.get_transport()
+        return transport is not None and transport.is_active()
+
+    def _drop(self, conn: _PooledConnection):
+        if conn.client is not None:
+            try:
+                conn.client.close()
+            except Exception:
+                pass
+            conn.client = None
+
+    def _connect(self, conn: _PooledConnection, target: SSHTarget, on_channel: Callable | None = None,
+                 is_aborted: Callable | None = None):
+        import paramiko  # heavy (cryptography, invoke), loaded with the first connection
+
+        now = time.monotonic()
+        if now < conn.next_retry:
+            raise paramiko.SSHException(f"reconnect to {target.ip} backing off, retry in {conn.next_retry - now:.1f}s")
+
+        was_connected = conn.client is not None
+        self._drop(conn)
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        sock = None
+        try:
+            with metrics.timer("ssh_connect", target.name):
+                if target.gateway is not None:
+                    sock = self._open_tunnel(target, on_channel, is_aborted)
+                else:
+                    sock = self._open_socket(target, on_channel)
+                client.connect(target.ip, port=target.port, username=target.username, password=target.password or None,
+                               key_filename=target.key_filename, sock=sock, timeout=target.connect_timeout,
+                               auth_timeout=target.auth_timeout, banner_timeout=target.banner_timeout)
+        except Exception:
+            client.close()
+            if sock is not None:
+                sock.close()
+            if is_aborted is not None and is_aborted():
+                logger.debug(f"Connect to {target.ip}:{target.port} aborted")
+                raise  # stopped by the caller, not a failure of the host
+            conn.failures += 1
+            delay = min(self.backoff_max, self.backoff_base * 2 ** (conn.failures - 1))
+            conn.next_retry = time.monotonic() + delay
+            self.stats["failures"] += 1
+            logger.debug(f"Connect to {target.ip}:{target.port} failed {conn.failures} times, next retry in {delay:.1f}s")
+            raise
+
+        if on_channel is not None:
+            on_channel(None)  # the socket now belongs to the pooled transport, possibly shared through a gateway
+        client.get_transport().set_keepalive(self.keepalive_interval)
+        conn.client = client
+        conn.failures = 0
+        conn.next_retry = 0.0
+        self.stats["handshakes"] += 1
+        if was_connected:
+            self.stats["reconnects"] += 1
+        via = f" via {target.gateway.ip}" if target.gateway is not None else ""
+        logger.debug(f"Opened pooled SSH connection to {target.username}@{target.ip}:{target.port}{via}")
+
+    @staticmethod
+    def _open_socket(target: SSHTarget, on_channel: Callable | None) -> socket.socket:
+        """ TCP connection opened here instead of by paramiko, so on_channel can close it while connect() still waits """
+        family, kind, proto, _, address = socket.getaddrinfo(target.ip, target.port, type=socket.SOCK_STREAM)[0]
+        sock = socket.socket(family, kind, proto)
+        if on_channel is not None:
+            on_channel(sock)
+        try:
+            sock.settimeout(target.connect_timeout)
+            sock.connect(address)
+        except Exception:
+            sock.close()
+            raise
+        return sock
+
+    def _open_tunnel(self, target: SSHTarget, on_channel: Callable | None, is_aborted: Callable | None) -> paramiko.Channel:
+        """ direct-tcpip channel to the target over the pooled connection to its gateway, one gateway login for all its hosts """
+        gateway = self._get_conn(target.gateway.key)
+        with gateway.lock:
+            self._ensure_connected(gateway, target.gateway, on_channel, is_aborted)
+            channel = gateway.client.get_transport().open_channel(
+                "direct-tcpip", (target.ip, target.port), ("127.0.0.1", 0), timeout=target.connect_timeout)
+        if on_channel is not None:
+            on_channel(channel)  # banner and auth of the target run over it
+        self.stats["tunnels"] += 1
+        return channel
+
+    def _ensure_connected(self, conn: _PooledConnection, target: SSHTarget, on_channel: Callable | None = None,
+                          is_aborted: Callable | None = None) -> bool:
+        """ 返回连接是否被复用 """
+        if self._is_alive(conn):
+            return True
+        self._connect(conn, target, on_channel, is_aborted)
+        return False
+
+    def _run(self, conn: _PooledConnection, target: SSHTarget, command: str, on_channel: Callable | None) -> str:
+        stdout = None
+        try:
+            with metrics.timer("ssh_command", target.name):
+                stdin, stdout, stderr = conn.client.exec_command(command, timeout=target.command_timeout)
+                if on_channel is not None:
+                    on_channel(stdout.channel)
+                return stdout.read().decode('utf-8')
+        except socket.timeout:
+            if stdout is not None:
+                stdout.channel.close()  # the transport is fine, only give up this command
+            raise TimeoutError(f"no output from '{target.ip}' for {target.command_timeout}s")
+
+    def exec_command(self, target: SSHTarget, command: str, on_channel: Callable | None = None,
+                     is_aborted: Callable | None = None) -> str:
+        """
+        在主机上执行命令并返回 stdout，必要时建立/重建连接
+        - on_channel(channel) 在每个阻塞阶段开始时被调用（建连的 socket、网关隧道、命令的 channel，None 表示无可关闭的对象），
+          调用方关闭它即可中断等待
+        - is_aborted() 为真时，失败的建连视为被调用方中断，不计入退避
+        """
+        import paramiko
+
+        conn = self._get_conn(target.key)
+        with conn.lock:
+            reused = self._ensure_connected(conn, target, on_channel, is_aborted)
+            try:
+                result = self._run(conn, target, command, on_channel)
+            except TimeoutError:
+                raise
+            except (paramiko.SSHException, EOFError, OSError):
+                if not reused:
+                    self._drop(conn)
+                    raise
+                # the transport looked alive but died under us, reconnect once
+                logger.debug(f"Pooled connection to {target.ip}:{target.port} went stale, reconnecting")
+                self._connect(conn, target, on_channel, is_aborted)
+                reused = False
+                result = self._run(conn, target, command, on_channel)
+            if reused:
+                self.stats["reuses"] += 1
+            return result
+
+    def open_channel(self, target: SSHTarget, command: str) -> paramiko.Channel:
+        """ 在复用的连接上打开一个长期运行命令的 channel，由调用方负责关闭 """
+        import paramiko
+
+        conn = self._get_conn(target.key)
+        with conn.lock:
+            reused = self._ensure_connected(conn, target)
+            try:
+                channel = conn.client.get_transport().open_session(timeout=target.command_timeout)
+            except (paramiko.SSHException, EOFError, OSError):
+                if not reused:
+                    self._drop(conn)
+                    raise
+                self._connect(conn, target)
+                reused = False
+                channel = conn.client.get_transport().open_session(timeout=target.command_timeout)
+            if reused:
+                self.stats["reuses"] += 1
+        channel.exec_command(command)
+        return channel
+
+    def close(self, target: SSHTarget):
+        with self._lock:
+            conn = self._conns.pop(target.key, None)
+        if conn is not None:
+            with conn.lock:
+                self._drop(conn)
+
+    def close_all(self):
+        with self._lock:
+            conns = list(self._conns.values())
+            self._conns.clear()
+        for conn in conns:
+            with conn.lock:
+                self._drop(conn)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            alive = sum(1 for conn in self._conns.values() if self._is_alive(conn))
+        return {**self.stats, "alive": alive}
+
+
+ssh_pool = SSHConnectionPool(
+    keepalive_interval=config.ssh_keepalive_interval,
+    backoff_base=config.ssh_reconnect_backoff_base,
+    backoff_max=config.ssh_reconnect_backoff_max,
+)
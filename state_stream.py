@@ -0,0 +1,174 @@
+"""
+push channel of the HTTP API, GET /api/stream: server-sent events with the changed fields of every new snapshot
+    event: snapshot   {"seq", "servers": {name: {...fields, "gpus": [record, ...]}}}
+    event: delta      {"seq", "server", "fields": {changed fields}, "gpus": {index: {changed fields}}, "gpus_reset": [record, ...] | null}
+deltas with a seq not above the one of the last snapshot are already part of it
+"""
+
+import json
+import time
+import threading
+from collections import deque
+
+from gpu_watcher import SSH_STATUS_LUT
+from http_api import _json_safe
+from logger import logger
+
+GPU_VOLATILE = {"timestamp"}  # changes on every sample, only sent along with another changed field of the GPU
+SERVER_FIELDS = ("message", "ssh_state", "stale", "restored_at", "poll_latency", "updated_at", "summary", "processes", "host")
+SERVER_VOLATILE = {"poll_latency", "updated_at"}  # change on every poll, only sent along with another changed field
+
+
+def format_event(event: str, seq: int, data: dict) -> bytes:
+    return f"id: {seq}\nevent: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8")
+
+
+class Subscriber:
+    """ 一个订阅者的有界队列，写不过来时丢弃积压的增量，改为发送一次完整快照 """
+
+    def __init__(self, max_queue: int):
+        self.max_queue = max_queue
+        self.events = deque()
+        self.overflowed = False
+        self.dropped = 0
+        self._ready = threading.Condition()
+
+    def push(self, event: bytes):
+        with self._ready:
+            if len(self.events) >= self.max_queue:
+                self.dropped += len(self.events)
+                self.events.clear()
+                self.overflowed = True
+            else:
+                self.events.append(event)
+            self._ready.notify()
+
+    def next(self, stream, timeout: float) -> bytes | None:
+        """ the next event to write, a full snapshot after an overflow, None when nothing arrived within timeout """
+        with self._ready:
+            if not self.events and not self.overflowed:
+                self._ready.wait(timeout)
+            if self.overflowed:
+                self.overflowed = False
+                self.events.clear()
+            elif self.events:
+                return self.events.popleft()
+            else:
+                return None
+        return stream.snapshot_event()
+
+
+class StateStream:
+    """
+    快照增量推送
+    - 每个新快照只和上一次推送的状态比较一次，增量序列化一次，由所有订阅者共享
+    - 事件带全局递增的 seq，新订阅者先收到一次完整快照，之后每隔 snapshot_interval 秒（有变化时）再推送一次完整快照用于校正
+    - 没有订阅者时不做任何工作
+    """
+
+    def __init__(self, collector, max_queue: int = 256, snapshot_interval: float = 60):
+        self.collector = collector
+        self.max_queue = max_queue
+        self.snapshot_interval = snapshot_interval
+        self.seq = 0
+        self.subscribers = set()
+        self._lock = threading.Lock()
+        self._servers = {}  # server -> fields last pushed
+        self._gpus = {}  # server -> GPU records last pushed
+        self._dirty = False  # a delta was pushed since the last full snapshot
+        self._thread = None
+        collector.add_listener(self._on_snapshot)
+
+    def subscribe(self) -> Subscriber:
+        subscriber = Subscriber(self.max_queue)
+        with self._lock:
+            if not self.subscribers:
+                self._reset()  # no baseline is kept while nobody listens
+            subscriber.push(self._snapshot_event())
+            self.subscribers.add(subscriber)
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._resync, name="gpu-state-stream", daemon=True)
+            self._thread.start()
+        logger.info(f"State stream: {len(self.subscribers)} subscribers")
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        with self._lock:
+            self.subscribers.discard(subscriber)
+        if subscriber.dropped:
+            logger.info(f"State stream subscriber left, {subscriber.dropped} events dropped for slow reading")
+
+    def _reset(self):
+        """ take the collector's current state as the baseline of the deltas """
+        self._servers, self._gpus = {}, {}
+        for name, snapshot in self.collector.snapshots().items():
+            self._diff(name, snapshot)
+
+    def _snapshot_event(self) -> bytes:
+        self._dirty = False
+        for name in self._servers.keys() - set(list(self.collector.watchers)):  # removed from server_info.json
+            del self._servers[name], self._gpus[name]
+        servers = {name: {**fields, "gpus": self._gpus[name]} for name, fields in self._servers.items()}
+        return format_event("snapshot", self.seq, {"seq": self.seq, "servers": _json_safe(servers)})
+
+    def snapshot_event(self) -> bytes:
+        """ the full state as of the last event, what a subscriber gets after falling behind """
+        with self._lock:
+            return self._snapshot_event()
+
+    def _diff(self, name: str, snapshot) -> dict:
+        """ changed fields of the server since the last push, the new values become the baseline """
+        data = _json_safe(snapshot.to_dict())
+        previous = self._servers.get(name, {})
+        delta = {}
+        gpus, old = data["gpus"], self._gpus.get(name)
+        if gpus is None and snapshot.ssh_state != SSH_STATUS_LUT["error"]:
+            self._gpus.setdefault(name, None)  # loading: clients keep the last values
+        elif gpus is None or old is None or len(gpus) != len(old):
+            if gpus != old:
+                delta["gpus_reset"] = gpus
+            self._gpus[name] = gpus
+        else:
+            changed_gpus = {}
+            for i, (record, before) in enumerate(zip(gpus, old)):
+                fields = {key: value for key, value in record.items() if before.get(key) != value}
+                if fields.keys() - GPU_VOLATILE:
+                    changed_gpus[str(i)] = fields
+            if changed_gpus:
+                delta["gpus"] = changed_gpus
+            self._gpus[name] = gpus
+
+        if snapshot.ssh_state == SSH_STATUS_LUT["loading"] and previous:
+            fields = {**previous, "stale": data["stale"]}  # a poll in flight is not a change, only the stale flag is
+        else:
+            fields = {key: data[key] for key in SERVER_FIELDS}
+        changed = {key: value for key, value in fields.items() if key not in previous or previous[key] != value}
+        if changed and (changed.keys() - SERVER_VOLATILE or delta):
+            delta["fields"] = changed
+            self._servers[name] = fields
+        elif not previous:
+            self._servers[name] = fields
+        return delta
+
+    def _on_snapshot(self, snapshot):
+        if not self.subscribers:
+            return
+        with self._lock:
+            delta = self._diff(snapshot.name, snapshot)
+            if not delta:
+                return
+            self.seq += 1
+            self._dirty = True
+            event = format_event("delta", self.seq, {"seq": self.seq, "server": snapshot.name, **delta})
+            for subscriber in self.subscribers:
+                subscriber.push(event)
+
+    def _resync(self):
+        while True:
+            time.sleep(self.snapshot_interval)
+            with self._lock:
+                if not self.subscribers or not self._dirty:
+                    continue
+                event = self._snapshot_event()
+                for subscriber in self.subscribers:
+                    subscriber.push(event)
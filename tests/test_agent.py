@@ -0,0 +1,82 @@
+""" gpu_agent.py end to end: the agent samples fake_nvidia_smi.py and pushes to an AgentReceiver on the poll engine """
+
+import os
+import sys
+import time
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from agent_receiver import AgentReceiver
+from gpu_watcher import SingleGPUServerWatcher, SSH_STATUS_LUT
+
+ROOT = Path(__file__).resolve().parent.parent
+pytestmark = pytest.mark.skipif(not sys.platform.startswith("linux"), reason="the agent reads /proc/loadavg")
+
+
+def _wait_for(condition, timeout: float = 10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.1)
+
+
+@pytest.fixture
+def receiver():
+    watchers = {name: SingleGPUServerWatcher(name, "", "", source="agent") for name in ("node-a", "node-b")}
+    receiver = AgentReceiver(watchers, token="secret", timeout=5)
+    server = receiver.start("127.0.0.1", 0)
+    yield receiver, server.sockets[0].getsockname()[1]
+    server.close()
+
+
+@pytest.fixture
+def start_agent():
+    agents = []
+
+    def start(port: int, name: str, token: str = "secret"):
+        agent = subprocess.Popen(
+            [sys.executable, str(ROOT / "gpu_agent.py"), "--collector", f"127.0.0.1:{port}", "--name", name,
+             "--interval", "0.2", "--token", token, "--nvidia-smi", str(ROOT / "fake_nvidia_smi.py")],
+            env=dict(os.environ, FAKE_GPUS="4"), stderr=subprocess.DEVNULL)
+        agents.append(agent)
+        return agent
+
+    yield start
+    for agent in agents:
+        agent.kill()
+        agent.wait()
+
+
+def test_agent_samples_reach_the_watcher(receiver, start_agent):
+    receiver, port = receiver
+    watcher = receiver.watchers["node-a"]
+    start_agent(port, "node-a")
+    _wait_for(lambda: watcher.snapshot.ssh_state == SSH_STATUS_LUT["success"])
+
+    snapshot = watcher.snapshot
+    assert len(snapshot.gpu_state) == 4
+    assert snapshot.gpu_state.uuid.tolist() == [f"GPU-fake-{i}" for i in range(4)]
+    assert len(snapshot.process_state) == 2 and all(snapshot.process_state.user)
+    assert snapshot.host_state["cpus"] >= 1
+    assert snapshot.summerized_gpu_state["have_free"]
+
+
+def test_rejected_agents_leave_the_watcher_waiting(receiver, start_agent):
+    receiver, port = receiver
+    start_agent(port, "node-b", token="wrong")
+    start_agent(port, "unknown")
+    time.sleep(1.5)
+    assert receiver.watchers["node-b"].snapshot.ssh_state == SSH_STATUS_LUT["loading"]
+    assert not receiver._writers
+
+
+def test_disconnect_marks_the_server_as_unreachable(receiver, start_agent):
+    receiver, port = receiver
+    watcher = receiver.watchers["node-a"]
+    agent = start_agent(port, "node-a")
+    _wait_for(lambda: watcher.snapshot.ssh_state == SSH_STATUS_LUT["success"])
+    agent.kill()
+    _wait_for(lambda: watcher.snapshot.ssh_state == SSH_STATUS_LUT["error"])
+    assert watcher.last_good is not None
@@ -0,0 +1,78 @@
+""" stop / restart of a watcher whose host accepts TCP but never sends the SSH banner """
+
+import time
+import socket
+
+import pytest
+
+import config
+from gpu_watcher import SingleGPUServerWatcher, SSH_STATUS_LUT
+from ssh_pool import ssh_pool
+
+
+@pytest.fixture
+def black_hole():
+    black_hole = socket.socket()
+    black_hole.bind(("127.0.0.1", 0))
+    black_hole.listen()
+    black_hole.settimeout(2)
+    yield black_hole
+    black_hole.close()
+
+
+@pytest.fixture
+def black_hole_watcher(black_hole):
+    # the timeouts are far above stop_timeout, only aborting the query can end it in time
+    watcher = SingleGPUServerWatcher("black-hole", "127.0.0.1", "nobody", port=black_hole.getsockname()[1],
+                                     update_step=1, connect_timeout=30, banner_timeout=30, auth_timeout=30)
+    yield watcher
+    watcher.stop_run()
+    ssh_pool.close(watcher.target)
+
+
+def _blocked(watcher, black_hole):
+    watcher.start_run(loop=True)
+    peer, _ = black_hole.accept()  # the query connected and now waits for the banner
+    time.sleep(0.2)
+    assert watcher.task is not None and not watcher.task.done()
+    return peer
+
+
+def _wait_for(condition, timeout: float = 2):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.05)
+
+
+def test_stop_run_interrupts_blocked_query(black_hole_watcher, black_hole):
+    peer = _blocked(black_hole_watcher, black_hole)
+    task = black_hole_watcher.task
+    start = time.perf_counter()
+    black_hole_watcher.stop_run()
+    assert time.perf_counter() - start < config.stop_timeout
+    assert task.done()
+    assert black_hole_watcher.task is None and not black_hole_watcher.is_looping
+
+    # the poll thread returns too, an aborted connect is neither an error nor a failure of the host
+    conn = ssh_pool._get_conn(black_hole_watcher.target.key)
+    _wait_for(lambda: not conn.lock.locked())
+    assert conn.failures == 0 and conn.next_retry == 0.0
+    assert black_hole_watcher.snapshot.ssh_state != SSH_STATUS_LUT["error"]
+    peer.close()
+
+
+def test_restart_run_interrupts_blocked_query(black_hole_watcher, black_hole):
+    peer = _blocked(black_hole_watcher, black_hole)
+    old = black_hole_watcher.task
+    start = time.perf_counter()
+    black_hole_watcher.restart_run(loop=True)
+    assert time.perf_counter() - start < config.stop_timeout
+    assert old.done()
+    assert black_hole_watcher.task is not old and black_hole_watcher.is_looping
+
+    # the restarted watch connects again right away instead of backing off
+    again, _ = black_hole.accept()
+    assert ssh_pool._get_conn(black_hole_watcher.target.key).failures == 0
+    peer.close()
+    again.close()